@@ -0,0 +1 @@
+"""Benchmarks reproducibles sin red: datos sintéticos y modelo simulado."""
@@ -0,0 +1,17 @@
+"""Medición de tiempos compartida por los benchmarks."""
+
+import time
+
+
+def cronometrar(funcion):
+    """Ejecuta ``funcion()`` y devuelve ``(segundos, resultado)``."""
+    inicio = time.perf_counter()
+    resultado = funcion()
+    return time.perf_counter() - inicio, resultado
+
+
+def medir(nombre, funcion, filas, unidad="filas"):
+    """Cronometra ``funcion()``, imprime el tiempo y el ritmo por ``unidad``, y devuelve su resultado."""
+    segundos, resultado = cronometrar(funcion)
+    print(f"{nombre:<40} {segundos:8.3f} s {filas / segundos:10.1f} {unidad}/s")
+    return resultado
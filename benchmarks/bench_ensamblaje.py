@@ -0,0 +1,51 @@
+"""Compara fichas por segundo: ensamblaje original vs. plantilla compilada.
+
+Uso (desde la raíz del repositorio):
+    python benchmarks/bench_ensamblaje.py --filas 300 --procesos 4
+"""
+
+import argparse
+import os
+import sys
+import zipfile
+from io import BytesIO
+
+from docxtpl import DocxTemplate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks._util import medir  # noqa: E402
+from benchmarks.sinteticos import libro_enriquecido, plantilla_docx  # noqa: E402
+from ensamblador.ensamblaje import ensamblar_zip, nombre_archivo  # noqa: E402
+
+
+def ensamblaje_original(df, plantilla, columna):
+    """Réplica del bucle anterior: una DocxTemplate nueva por fila, en serie."""
+    plantilla_bytes = BytesIO(plantilla)
+    zip_buffer = BytesIO()
+    with zipfile.ZipFile(zip_buffer, "a", zipfile.ZIP_DEFLATED, False) as zip_file:
+        for _, fila in df.iterrows():
+            doc = DocxTemplate(plantilla_bytes)
+            doc.render(fila.to_dict())
+            doc_buffer = BytesIO()
+            doc.save(doc_buffer)
+            zip_file.writestr(nombre_archivo(fila[columna]), doc_buffer.getvalue())
+    return zip_buffer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, default=300)
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    plantilla = plantilla_docx()
+    df = libro_enriquecido(args.filas)
+    medir("original (serie)", lambda: ensamblaje_original(df, plantilla, "ItemId"), args.filas, "fichas")
+    medir("compilada, 1 proceso", lambda: ensamblar_zip(df, plantilla, "ItemId", BytesIO(), procesos=1), args.filas, "fichas")
+    medir(f"compilada, hasta {args.procesos} procesos",
+          lambda: ensamblar_zip(df, plantilla, "ItemId", BytesIO(), procesos=args.procesos), args.filas, "fichas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Compara la ingesta original (``apply`` celda a celda) con la limpieza por columna.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_ingesta --filas 20000 --columnas-extra 40
+"""
+
+import argparse
+import os
+import re
+import sys
+from io import BytesIO
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks._util import medir  # noqa: E402
+from benchmarks.sinteticos import excel_bytes, libro_items  # noqa: E402
+from ensamblador.limpieza import leer_excel_limpio  # noqa: E402
+from ensamblador.prompts import COLUMNAS_PROMPT  # noqa: E402
+
+
+def limpiar_html_original(texto_html):
+    """Réplica de la función anterior: recompila la expresión en cada llamada."""
+    if not isinstance(texto_html, str):
+        return texto_html
+    cleanr = re.compile('<.*?>')
+    return re.sub(cleanr, '', texto_html)
+
+
+def ingesta_original(contenido):
+    df = pd.read_excel(BytesIO(contenido))
+    for col in df.columns:
+        if df[col].dtype == 'object' or pd.api.types.is_string_dtype(df[col]):
+            df[col] = df[col].apply(limpiar_html_original)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, default=5000)
+    parser.add_argument("--columnas-extra", type=int, default=20,
+                        help="Columnas de texto que los prompts no usan (como en las exportaciones reales).")
+    args = parser.parse_args()
+
+    df = libro_items(args.filas)
+    for i in range(args.columnas_extra):
+        df[f"Extra{i}"] = df["Pregunta"]
+    contenido = excel_bytes(df)
+
+    datos = pd.read_excel(BytesIO(contenido))
+    texto = [c for c in datos.columns if datos[c].dtype == 'object' or pd.api.types.is_string_dtype(datos[c])]
+    medir("limpieza original (apply)", lambda: [datos[c].apply(limpiar_html_original) for c in texto], args.filas)
+    from ensamblador.limpieza import limpiar_columna
+    medir("limpieza por columna", lambda: [limpiar_columna(datos[c]) for c in texto], args.filas)
+
+    medir("ingesta original completa", lambda: ingesta_original(contenido), args.filas)
+    medir("ingesta nueva completa", lambda: leer_excel_limpio(BytesIO(contenido)), args.filas)
+    medir("ingesta nueva, solo columnas prompt",
+          lambda: leer_excel_limpio(BytesIO(contenido), COLUMNAS_PROMPT + ["ItemId"]), args.filas)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Compara la construcción de prompts fila a fila con las plantillas compiladas.
+
+Mide el tiempo de armar los prompts de análisis y de recomendaciones y los
+tokens de entrada estimados por ítem (instrucción de sistema incluida, que
+la API cobra en cada llamada), también en modo lote.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.bench_prompts --filas 5000
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks._util import medir  # noqa: E402
+from benchmarks.sinteticos import libro_items  # noqa: E402
+from ensamblador.limitador import estimar_tokens  # noqa: E402
+from ensamblador.lotes import construir_prompt_lote, insumos_items, instrucciones_lote  # noqa: E402
+from ensamblador.prompts import ENCABEZADO_INSUMOS, PLANTILLA_ANALISIS, PLANTILLA_RECOMENDACIONES  # noqa: E402
+
+
+def prompt_por_fila(fila, plantilla, prompt_adicional):
+    """Réplica de la construcción anterior: ``fillna`` y el texto completo en cada fila."""
+    fila = fila.fillna('')
+    insumos = "\n".join(f"- {etiqueta}: {fila.get(columna, defecto)}" for columna, etiqueta, defecto in plantilla.insumos)
+    return f"{plantilla.sistema(prompt_adicional)}\n\n{ENCABEZADO_INSUMOS}{insumos}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filas", type=int, default=5000)
+    parser.add_argument("--lote", type=int, default=10)
+    parser.add_argument("--prompt-adicional", default="Usa ejemplos cotidianos de Bogotá.")
+    args = parser.parse_args()
+
+    df = libro_items(args.filas)
+    plantillas = (("análisis", PLANTILLA_ANALISIS), ("recomendaciones", PLANTILLA_RECOMENDACIONES))
+    for nombre, plantilla in plantillas:
+        medir(f"{nombre}: fila a fila", lambda: [prompt_por_fila(df.loc[i], plantilla, args.prompt_adicional)
+                                                  for i in df.index], args.filas)
+        prompts = medir(f"{nombre}: plantilla compilada", lambda: plantilla.rellenar(df), args.filas)
+        sistema = estimar_tokens(plantilla.sistema(args.prompt_adicional))
+        insumos = sum(estimar_tokens(p) for p in prompts.values()) / len(prompts)
+        print(f"    tokens por ítem: {sistema} de sistema + {insumos:.0f} de insumos")
+
+    insumos = medir("lote: insumos por columna", lambda: insumos_items(df, df.index), args.filas)
+    items = list(insumos.items())
+    sistema = estimar_tokens(instrucciones_lote(args.prompt_adicional))
+    peticiones = [construir_prompt_lote(items[k:k + args.lote]) for k in range(0, len(items), args.lote)]
+    por_item = (sistema * len(peticiones) + sum(map(estimar_tokens, peticiones))) / len(items)
+    print(f"    tokens por ítem con lotes de {args.lote}: {por_item:.0f}")
+
+
+if __name__ == "__main__":
+    main()
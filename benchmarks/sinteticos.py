@@ -0,0 +1,70 @@
+"""Libros de ítems y plantillas de Word sintéticos para los benchmarks."""
+
+import random
+from io import BytesIO
+
+import pandas as pd
+from docx import Document
+
+CAMPOS_ENRIQUECIDOS = ["Que_Evalua", "Justificacion_Correcta", "Analisis_Distractores",
+                       "Recomendacion_Fortalecer", "Recomendacion_Avanzar"]
+
+_PALABRAS = ("número", "fracción", "tabla", "gráfico", "estudiante", "medida", "área", "perímetro",
+             "suma", "resta", "patrón", "secuencia", "datos", "probabilidad", "ángulo", "razón")
+
+
+def _texto_html(rng, palabras):
+    cuerpo = " ".join(rng.choice(_PALABRAS) for _ in range(palabras))
+    return f"<p>{cuerpo[:40]} <b>{cuerpo[40:80]}</b>&nbsp;{cuerpo[80:]}</p>"
+
+
+def libro_items(filas, semilla=0):
+    """DataFrame con las columnas que leen los prompts, con HTML enriquecido en las celdas."""
+    rng = random.Random(semilla)
+    return pd.DataFrame({
+        "ItemId": [f"ITEM{i:06d}" for i in range(filas)],
+        "ItemContexto": [_texto_html(rng, 60) for _ in range(filas)],
+        "Pregunta": [_texto_html(rng, 25) for _ in range(filas)],
+        "Enunciado": [_texto_html(rng, 25) for _ in range(filas)],
+        "Imagen_pregunta": ["No aplica"] * filas,
+        "ComponenteNombre": [rng.choice(["Numérico", "Geométrico", "Aleatorio"]) for _ in range(filas)],
+        "CompetenciaNombre": [rng.choice(["Comunicación", "Resolución", "Razonamiento"]) for _ in range(filas)],
+        "AfirmacionNombre": [_texto_html(rng, 15) for _ in range(filas)],
+        "EvidenciaNombre": [_texto_html(rng, 15) for _ in range(filas)],
+        "ItemGradoId": [rng.choice([3, 6, 9]) for _ in range(filas)],
+        "OpcionA": [_texto_html(rng, 6) for _ in range(filas)],
+        "OpcionB": [_texto_html(rng, 6) for _ in range(filas)],
+        "OpcionC": [_texto_html(rng, 6) for _ in range(filas)],
+        "OpcionD": [_texto_html(rng, 6) for _ in range(filas)],
+        "AlternativaClave": [rng.choice("ABCD") for _ in range(filas)],
+    })
+
+
+def libro_enriquecido(filas, semilla=0):
+    """Libro de ítems con las cinco columnas que agrega el enriquecimiento."""
+    df = libro_items(filas, semilla)
+    texto = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 20
+    for campo in CAMPOS_ENRIQUECIDOS:
+        df[campo] = texto
+    return df
+
+
+def excel_bytes(df):
+    salida = BytesIO()
+    df.to_excel(salida, index=False)
+    return salida.getvalue()
+
+
+def plantilla_docx(parrafos=40):
+    """Plantilla de Word con un encabezado, una tabla de campos y texto fijo."""
+    doc = Document()
+    doc.add_heading("Ficha técnica {{ ItemId }}", level=1)
+    tabla = doc.add_table(rows=len(CAMPOS_ENRIQUECIDOS), cols=2)
+    for fila, campo in zip(tabla.rows, CAMPOS_ENRIQUECIDOS):
+        fila.cells[0].text = campo
+        fila.cells[1].text = "{{ %s }}" % campo
+    for _ in range(parrafos):
+        doc.add_paragraph("Texto fijo de la plantilla con {{ Enunciado }} y la clave {{ AlternativaClave }}.")
+    salida = BytesIO()
+    doc.save(salida)
+    return salida.getvalue()
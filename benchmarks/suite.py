@@ -0,0 +1,134 @@
+"""Suite de rendimiento sin red ni cuota, con un modelo de Gemini simulado.
+
+Para cada tamaño genera un libro de ítems y una plantilla sintéticos y mide
+la ingesta, cada fase de enriquecimiento, la exportación a Excel y el
+ensamblaje del ZIP. Los resultados se guardan en JSON para compararlos
+entre versiones:
+
+    python -m benchmarks.suite --tamanos 100,1000 --salida resultados.json
+    python -m benchmarks.suite --tamanos 100,1000,10000 --comparar resultados.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks._util import cronometrar  # noqa: E402
+from benchmarks.sinteticos import excel_bytes, libro_items, plantilla_docx  # noqa: E402
+from ensamblador.ensamblaje import SalidaZip, ensamblar_zip  # noqa: E402
+from ensamblador.exportacion import exportar_excel  # noqa: E402
+from ensamblador.flujo import Configuracion, enriquecer_dataframe  # noqa: E402
+from ensamblador.limpieza import leer_excel_limpio  # noqa: E402
+from ensamblador.motor import ANALISIS, RECOMENDACIONES  # noqa: E402
+from ensamblador.simulado import ModeloSimulado  # noqa: E402
+
+SALIDA_POR_DEFECTO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados.json")
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def ejecutar_tamano(filas, args):
+    """Mide todas las fases para un libro de ``filas`` ítems; devuelve ``{fase: métricas}``."""
+    contenido_excel = excel_bytes(libro_items(filas, semilla=filas))
+    plantilla = plantilla_docx()
+    modelo = ModeloSimulado(latencia=args.latencia, tasa_error=args.tasa_error, tasa_429=args.tasa_429)
+    config = Configuracion(max_concurrencia=args.concurrencia, tam_lote=args.lote,
+                           rpm=10**9, tpm=10**12, usar_cache=False)
+    fases = {}
+
+    segundos, df = cronometrar(lambda: leer_excel_limpio(BytesIO(contenido_excel)))
+    fases["ingesta"] = segundos
+
+    for fase, pendientes in (("analisis", {ANALISIS: list(df.index), RECOMENDACIONES: []}),
+                             ("recomendaciones", {ANALISIS: [], RECOMENDACIONES: list(df.index)})):
+        if args.lote > 1 and fase == "recomendaciones":
+            # En modo lote una sola pasada llena las cinco columnas.
+            continue
+        segundos, _ = cronometrar(lambda: enriquecer_dataframe(modelo, df, config, pendientes))
+        fases[fase if args.lote == 1 else "lote"] = segundos
+
+    segundos, excel = cronometrar(lambda: exportar_excel(df))
+    excel.close()
+    fases["exportacion_excel"] = segundos
+
+    with tempfile.TemporaryDirectory() as directorio:
+        destino = os.path.join(directorio, "fichas.zip")
+        segundos, _ = cronometrar(lambda: ensamblar_zip(df, plantilla, "ItemId", SalidaZip(destino), procesos=args.procesos))
+    fases["ensamblaje_zip"] = segundos
+
+    return {fase: {"segundos": round(s, 4), "filas_por_segundo": round(filas / s, 2) if s else None}
+            for fase, s in fases.items()} | {"llamadas_api": modelo.llamadas, "tokens_entrada": modelo.tokens_entrada}
+
+
+def comparar(actual, anterior):
+    """Imprime la variación de tiempo por fase frente a un resultado anterior."""
+    for tamano, fases in actual["tamanos"].items():
+        previas = anterior.get("tamanos", {}).get(tamano)
+        if not previas:
+            continue
+        for fase, metricas in fases.items():
+            if not isinstance(metricas, dict) or fase not in previas:
+                continue
+            antes, ahora = previas[fase]["segundos"], metricas["segundos"]
+            cambio = (ahora - antes) / antes * 100 if antes else 0.0
+            marca = "  <-- regresión" if cambio > 10 else ""
+            print(f"{tamano:>7} {fase:<18} {antes:9.3f} s -> {ahora:9.3f} s ({cambio:+6.1f} %){marca}")
+        for contador in ("llamadas_api", "tokens_entrada"):
+            if contador in fases and contador in previas:
+                print(f"{tamano:>7} {contador:<18} {previas[contador]:>11,} -> {fases[contador]:>11,}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Suite de rendimiento con modelo simulado.")
+    parser.add_argument("--tamanos", default="100,1000", help="Filas por libro, separadas por comas (p. ej. 100,1000,10000).")
+    parser.add_argument("--latencia", default="lognormal:0.02,0.5", help="fija:s | uniforme:a,b | lognormal:mediana,sigma")
+    parser.add_argument("--tasa-error", type=float, default=0.0, help="Fracción de llamadas con error 503.")
+    parser.add_argument("--tasa-429", type=float, default=0.0, help="Fracción de llamadas con error 429.")
+    parser.add_argument("--concurrencia", type=int, default=16)
+    parser.add_argument("--lote", type=int, default=1)
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--salida", default=SALIDA_POR_DEFECTO, help="Archivo JSON de resultados.")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior para mostrar la variación.")
+    args = parser.parse_args(argv)
+
+    resultados = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "parametros": {k: v for k, v in vars(args).items() if k not in ("salida", "comparar")},
+        "tamanos": {},
+    }
+    for filas in (int(t) for t in args.tamanos.split(",") if t):
+        print(f"== {filas} filas", file=sys.stderr, flush=True)
+        resultados["tamanos"][str(filas)] = ejecutar_tamano(filas, args)
+        for fase, metricas in resultados["tamanos"][str(filas)].items():
+            if isinstance(metricas, dict):
+                print(f"{fase:<18} {metricas['segundos']:9.3f} s {metricas['filas_por_segundo'] or 0:11.1f} filas/s")
+
+    with open(args.salida, "w", encoding="utf-8") as archivo:
+        json.dump(resultados, archivo, ensure_ascii=False, indent=2)
+    print(f"Resultados en {args.salida}", file=sys.stderr)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as archivo:
+            comparar(resultados, json.load(archivo))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Lógica reutilizable del Ensamblador de Fichas Técnicas con IA."""
@@ -0,0 +1,7 @@
+import time
+
+_inicio = time.perf_counter()
+
+from .cli import main  # noqa: E402
+
+raise SystemExit(main(inicio=_inicio))
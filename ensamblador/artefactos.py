@@ -0,0 +1,111 @@
+"""Caché en memoria de artefactos derivados, para no rehacerlos en cada rerun.
+
+Streamlit vuelve a ejecutar la página con cada cambio de un control; sin
+esta caché se releía el Excel subido o se regeneraba el Excel enriquecido
+aunque nada hubiera cambiado. Cada artefacto se guarda bajo una clave que
+incluye la :func:`huella` de sus entradas (DataFrame, plantilla,
+configuración), así solo se reconstruye cuando estas cambian. Los más
+antiguos se descartan al superar el presupuesto de memoria. Los archivos
+exportados (bytes listos para descargar) van en una caché aparte con un
+presupuesto menor, ``MAX_MB_EXPORTACIONES``, para que un banco grande no
+desaloje los libros ya leídos.
+"""
+
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+MAX_MB_POR_DEFECTO = int(os.environ.get("ENSAMBLADOR_ARTEFACTOS_MB", "512"))
+MAX_MB_EXPORTACIONES = int(os.environ.get("ENSAMBLADOR_EXPORTACIONES_MB", "64"))
+MAX_ENTRADAS = 256
+
+
+def huella(*partes):
+    """Hash sha256 del contenido de ``partes`` (bytes, DataFrames o valores simples)."""
+    h = hashlib.sha256()
+    for parte in partes:
+        if isinstance(parte, (bytes, bytearray, memoryview)):
+            h.update(parte)
+        elif hasattr(parte, "columns") and hasattr(parte, "index"):
+            import pandas as pd
+
+            h.update(repr([str(columna) for columna in parte.columns]).encode("utf-8"))
+            h.update(pd.util.hash_pandas_object(parte, index=True).values.tobytes())
+        else:
+            h.update(repr(parte).encode("utf-8"))
+        h.update(b"\x1e")
+    return h.hexdigest()
+
+
+def _tamano(valor):
+    if isinstance(valor, (bytes, bytearray)):
+        return len(valor)
+    if hasattr(valor, "memory_usage"):
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    return sys.getsizeof(valor)
+
+
+class CacheArtefactos:
+    """LRU de artefactos acotada por ``max_bytes``, segura entre hilos y sesiones.
+
+    Los valores se comparten: quien vaya a modificar uno (p. ej. un
+    DataFrame) debe trabajar sobre una copia.
+    """
+
+    def __init__(self, max_bytes=MAX_MB_POR_DEFECTO * 1024 * 1024, max_entradas=MAX_ENTRADAS):
+        self.max_bytes = max_bytes
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._ocupado = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def buscar(self, clave):
+        """Valor guardado para ``clave``, o None."""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[0]
+
+    def guardar(self, clave, valor, tamano=None):
+        tamano = _tamano(valor) if tamano is None else tamano
+        with self._lock:
+            if clave in self._entradas:
+                self._ocupado -= self._entradas.pop(clave)[1]
+            self._entradas[clave] = (valor, tamano)
+            self._ocupado += tamano
+            # El más reciente se conserva aunque por sí solo supere el presupuesto.
+            while len(self._entradas) > 1 and (self._ocupado > self.max_bytes or len(self._entradas) > self.max_entradas):
+                _, (_, liberado) = self._entradas.popitem(last=False)
+                self._ocupado -= liberado
+        return valor
+
+    def obtener(self, clave, construir):
+        """Devuelve el artefacto de ``clave``, construyéndolo con ``construir()`` si falta."""
+        valor = self.buscar(clave)
+        if valor is None:
+            valor = self.guardar(clave, construir())
+        return valor
+
+    def descartar(self, clave):
+        with self._lock:
+            entrada = self._entradas.pop(clave, None)
+            if entrada is not None:
+                self._ocupado -= entrada[1]
+
+    def vaciar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._ocupado = 0
+
+    def resumen(self):
+        with self._lock:
+            return {"entradas": len(self._entradas), "bytes": self._ocupado,
+                    "aciertos": self.aciertos, "fallos": self.fallos}
@@ -0,0 +1,121 @@
+"""Bitácora de resultados para reanudar ejecuciones interrumpidas.
+
+Cada resultado se añade a un archivo JSONL en cuanto llega, indexado por la
+columna que identifica la fila. Si la ejecución se corta (recarga del
+navegador, rerun de Streamlit, caída del proceso), la siguiente solo genera
+lo que falta y lo ya hecho puede descargarse en cualquier momento.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+from .motor import TIPOS, aplicar_resultados, es_error
+
+DIRECTORIO_POR_DEFECTO = os.environ.get(
+    "ENSAMBLADOR_BITACORAS", os.path.join(os.path.expanduser("~"), ".cache", "ensamblador", "bitacoras")
+)
+
+
+def ruta_bitacora(contenido, firma=None, directorio=DIRECTORIO_POR_DEFECTO):
+    """Ruta de la bitácora de un libro de Excel y una configuración.
+
+    El nombre es un hash del contenido del libro y de ``firma`` (ver
+    :func:`~ensamblador.flujo.firma_ejecucion`): al cambiar los prompts, el
+    modelo o el tamaño de lote se empieza una bitácora nueva en lugar de
+    recuperar las respuestas de la configuración anterior.
+    """
+    h = hashlib.sha256(contenido)
+    if firma is not None:
+        h.update(json.dumps(firma, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return os.path.join(directorio, h.hexdigest()[:32] + ".jsonl")
+
+
+def identidades(df, columna_id):
+    """Identidad de cada fila: la columna indicada si existe y es única, o la posición."""
+    if columna_id in df.columns and df[columna_id].is_unique:
+        return df[columna_id].astype(str)
+    return df.index.to_series().astype(str)
+
+
+class Bitacora:
+    """Diario de solo-añadir con el último resultado de cada (identidad, tipo)."""
+
+    def __init__(self, ruta):
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._archivo = open(ruta, "a", encoding="utf-8")
+        if self._archivo.tell() > 0:
+            with open(ruta, "rb") as archivo:
+                archivo.seek(-1, os.SEEK_END)
+                if archivo.read(1) != b"\n":
+                    # Cierra la línea truncada para no corromper el siguiente registro.
+                    self._archivo.write("\n")
+
+    def registrar(self, identidad, tipo, valores):
+        linea = json.dumps({"id": str(identidad), "tipo": tipo, "valores": valores}, ensure_ascii=False)
+        with self._lock:
+            self._archivo.write(linea + "\n")
+            self._archivo.flush()
+
+    def cargar(self):
+        """Devuelve ``{(identidad, tipo): {columna: valor}}``; gana la última línea."""
+        hechos = {}
+        with self._lock:
+            self._archivo.flush()
+            with open(self.ruta, encoding="utf-8") as archivo:
+                for linea in archivo:
+                    try:
+                        registro = json.loads(linea)
+                    except ValueError:
+                        # Línea truncada por una caída a mitad de escritura.
+                        continue
+                    hechos[(registro["id"], registro["tipo"])] = registro["valores"]
+        return hechos
+
+    def descartar(self):
+        """Borra todos los resultados guardados."""
+        with self._lock:
+            self._archivo.close()
+            self._archivo = open(self.ruta, "w", encoding="utf-8")
+
+    def cerrar(self):
+        with self._lock:
+            self._archivo.close()
+
+
+def reanudar(df, bitacora, columna_id):
+    """Copia en ``df`` los resultados válidos de la bitácora.
+
+    Devuelve ``(pendientes, recuperados)``: los índices que aún faltan por
+    cada tipo (``{tipo: índices}``) y cuántos resultados se recuperaron.
+    """
+    hechos = bitacora.cargar()
+    ids = identidades(df, columna_id)
+    pendientes = {tipo: [] for tipo in TIPOS}
+    resultados = {}
+    recuperados = 0
+    for indice, identidad in ids.items():
+        for tipo, (columnas, _) in TIPOS.items():
+            valores = hechos.get((identidad, tipo))
+            if valores is None or any(es_error(valores.get(c)) for c in columnas):
+                pendientes[tipo].append(indice)
+                continue
+            recuperados += 1
+            for columna in columnas:
+                resultados.setdefault(columna, {})[indice] = valores.get(columna)
+    aplicar_resultados(df, resultados)
+    return pendientes, recuperados
+
+
+def recuperar(df, ruta, columna_id):
+    """Abre la bitácora de ``ruta``, aplica :func:`reanudar` y la cierra."""
+    bitacora = Bitacora(ruta)
+    try:
+        return reanudar(df, bitacora, columna_id)
+    finally:
+        bitacora.cerrar()
@@ -0,0 +1,120 @@
+"""Caché persistente de respuestas del modelo en SQLite.
+
+Cada entrada se indexa con el hash del prompt junto con el nombre del modelo
+y su ``generation_config``: si cualquiera cambia, la respuesta se genera de
+nuevo. Las entradas se descartan por antigüedad y, cuando la base supera su
+tamaño máximo, por uso menos reciente.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+RUTA_POR_DEFECTO = os.environ.get(
+    "ENSAMBLADOR_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "ensamblador", "respuestas.sqlite")
+)
+MAX_MB_POR_DEFECTO = 500
+MAX_DIAS_POR_DEFECTO = 30
+
+
+def clave_respuesta(prompt, firma_modelo=None):
+    """Hash estable del prompt y de la firma del modelo (nombre y configuración)."""
+    contenido = json.dumps({"prompt": prompt, "modelo": firma_modelo or {}}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+class CacheRespuestas:
+    """Almacén clave-respuesta compartible entre los hilos del motor.
+
+    Con ``leer=False`` la caché se salta en la lectura pero se sigue
+    escribiendo, lo que sirve para forzar respuestas nuevas y refrescarla.
+    """
+
+    def __init__(self, ruta=RUTA_POR_DEFECTO, max_mb=MAX_MB_POR_DEFECTO, max_dias=MAX_DIAS_POR_DEFECTO, leer=True):
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self.ruta = ruta
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_segundos = max_dias * 86400
+        self.leer = leer
+        self.aciertos = 0
+        self.fallos = 0
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute(
+            "CREATE TABLE IF NOT EXISTS respuestas ("
+            "clave TEXT PRIMARY KEY, texto TEXT NOT NULL, bytes INTEGER NOT NULL, "
+            "creado REAL NOT NULL, usado REAL NOT NULL)"
+        )
+        self._conexion.commit()
+        self.purgar()
+
+    def obtener(self, clave, valida=None):
+        """Devuelve la respuesta guardada o None, y actualiza los contadores.
+
+        Si ``valida(texto)`` es falso (p. ej. una respuesta que no se pudo
+        separar), la entrada se borra y cuenta como fallo.
+        """
+        if not self.leer:
+            with self._lock:
+                self.fallos += 1
+            return None
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT texto, creado FROM respuestas WHERE clave = ?", (clave,)
+            ).fetchone()
+            if fila is None or time.time() - fila[1] > self.max_segundos:
+                self.fallos += 1
+                return None
+        if valida is not None and not valida(fila[0]):
+            with self._lock:
+                self._conexion.execute("DELETE FROM respuestas WHERE clave = ?", (clave,))
+                self._conexion.commit()
+                self.fallos += 1
+            return None
+        with self._lock:
+            self._conexion.execute("UPDATE respuestas SET usado = ? WHERE clave = ?", (time.time(), clave))
+            self._conexion.commit()
+            self.aciertos += 1
+        return fila[0]
+
+    def guardar(self, clave, texto):
+        ahora = time.time()
+        with self._lock:
+            self._conexion.execute(
+                "INSERT OR REPLACE INTO respuestas VALUES (?, ?, ?, ?, ?)",
+                (clave, texto, len(texto.encode("utf-8")), ahora, ahora),
+            )
+            self._conexion.commit()
+
+    def purgar(self):
+        """Elimina entradas vencidas y, si hace falta, las menos usadas hasta caber en ``max_bytes``."""
+        with self._lock:
+            self._conexion.execute("DELETE FROM respuestas WHERE creado < ?", (time.time() - self.max_segundos,))
+            acumulado, sobrantes = 0, []
+            for clave, tamano in self._conexion.execute("SELECT clave, bytes FROM respuestas ORDER BY usado DESC"):
+                acumulado += tamano
+                if acumulado > self.max_bytes:
+                    sobrantes.append((clave,))
+            self._conexion.executemany("DELETE FROM respuestas WHERE clave = ?", sobrantes)
+            self._conexion.commit()
+
+    def vaciar(self):
+        with self._lock:
+            self._conexion.execute("DELETE FROM respuestas")
+            self._conexion.commit()
+
+    def resumen(self):
+        """Número de entradas y tamaño total (en bytes) almacenados."""
+        with self._lock:
+            entradas, tamano = self._conexion.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM respuestas").fetchone()
+        return {"entradas": entradas, "bytes": tamano}
+
+    def cerrar(self):
+        with self._lock:
+            self._conexion.close()
@@ -0,0 +1,225 @@
+"""Línea de comandos para enriquecer y ensamblar sin la interfaz de Streamlit.
+
+    python -m ensamblador enrich items.xlsx --out enriquecido.xlsx
+    python -m ensamblador assemble enriquecido.xlsx plantilla.docx --zip fichas.zip
+
+La clave de la API se toma de ``--api-key`` o de ``GOOGLE_API_KEY``. Los
+módulos pesados (pandas, SDK de Google, docxtpl) se importan dentro de cada
+comando, así ``--help`` responde al instante; el tiempo de arranque se
+informa por stderr.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import time
+
+from .cache import MAX_DIAS_POR_DEFECTO, MAX_MB_POR_DEFECTO
+from .limitador import RPM_POR_DEFECTO, TPM_POR_DEFECTO
+from .motor import CONCURRENCIA_POR_DEFECTO
+from .prompts import PRESUPUESTO_TOKENS_POR_DEFECTO
+from .telemetria import Telemetria, perfil
+
+
+def _informar(mensaje):
+    print(mensaje, file=sys.stderr, flush=True)
+
+
+def _progreso(etiqueta):
+    ultimo = [0.0]
+
+    def al_avanzar(hechos, total):
+        ahora = time.monotonic()
+        if hechos == total or ahora - ultimo[0] >= 1:
+            ultimo[0] = ahora
+            _informar(f"{etiqueta}: {hechos}/{total}")
+    return al_avanzar
+
+
+def _informar_telemetria(resumen):
+    for nombre, valores in resumen["tiempos"].items():
+        _informar(f"  {nombre:<24} n={valores['n']:<6} p50={valores['p50']:.3f}s p95={valores['p95']:.3f}s "
+                  f"p99={valores['p99']:.3f}s total={valores['total']:.1f}s")
+    for nombre, valor in sorted(resumen["contadores"].items()):
+        _informar(f"  {nombre:<24} {valor:,}")
+    if resumen.get("costo"):
+        _informar(f"  Costo estimado: US$ {resumen['costo']:.4f}")
+        for tipo, costo in sorted(resumen.get("costo_por_tipo", {}).items()):
+            _informar(f"    {tipo:<22} US$ {costo:.4f}")
+
+
+def comando_enrich(args, telemetria=None):
+    from .bitacora import recuperar, ruta_bitacora
+    from .exportacion import exportar_excel
+    from .flujo import Configuracion, enriquecer_dataframe, firma_ejecucion, planificar_ejecucion, todas_las_filas
+    from .limpieza import leer_excel_limpio
+    from .modelo import setup_model
+    from .motor import filas_con_error
+    from .prompts import COLUMNAS_PROMPT
+    from .respuestas import COLUMNAS_GENERADAS
+
+    api_key = args.api_key or os.environ.get("GOOGLE_API_KEY")
+    if not api_key:
+        _informar("Falta la clave de la API: usa --api-key o define GOOGLE_API_KEY.")
+        return 2
+
+    config = Configuracion(
+        columna_id=args.columna_id,
+        max_concurrencia=args.concurrencia,
+        tam_lote=args.lote,
+        rpm=args.rpm,
+        tpm=args.tpm,
+        prompt_adicional_analisis=args.prompt_analisis,
+        prompt_adicional_recomendaciones=args.prompt_recomendaciones,
+        usar_cache=not args.sin_cache,
+        # Las filas con ERROR se vuelven a pedir al modelo, no a la caché.
+        omitir_cache=args.refrescar_cache or args.solo_errores,
+        cache_max_mb=args.cache_max_mb,
+        cache_max_dias=args.cache_max_dias,
+        deduplicar=not args.sin_deduplicar,
+        max_tokens_prompt=args.max_tokens_prompt,
+    )
+    with open(args.excel, "rb") as archivo:
+        contenido = archivo.read()
+    # Con --solo-errores las columnas generadas se leen siempre y sin limpiar.
+    df = leer_excel_limpio(args.excel, COLUMNAS_PROMPT + [args.columna_id] if args.solo_columnas_prompt else None, telemetria,
+                           COLUMNAS_GENERADAS if args.solo_errores else ())
+    ruta = ruta_bitacora(contenido, firma_ejecucion(config))
+    pendientes = todas_las_filas(df)
+    if not args.sin_reanudar:
+        pendientes, recuperados = recuperar(df, ruta, config.columna_id)
+        if recuperados:
+            _informar(f"Se recuperaron {recuperados} resultado(s) guardados.")
+    if args.solo_errores:
+        # El Excel ya está enriquecido: solo se regeneran las filas marcadas como ERROR.
+        pendientes = filas_con_error(df)
+        _informar(f"{len(set().union(*pendientes.values()))} fila(s) con ERROR por regenerar.")
+
+    plan = planificar_ejecucion(df, pendientes, config)
+    if plan.llamadas_ahorradas:
+        _informar(f"Ítems repetidos: {plan.proporcion_duplicados:.0%} de las filas; "
+                  f"{plan.llamadas} llamadas en lugar de {plan.llamadas_sin_deduplicar}.")
+    avance = _progreso("Enriquecimiento")
+
+    def al_completar(trabajo, error, completados, total):
+        if error is not None:
+            _informar(f"Error en fila {trabajo.indice + 1} ({trabajo.tipo}): {error}")
+        avance(completados, total)
+
+    model = setup_model(api_key)
+    df, estadisticas_cache = enriquecer_dataframe(model, df, config, pendientes, ruta, al_completar, plan, telemetria)
+    if estadisticas_cache:
+        _informar(f"Caché: {estadisticas_cache['aciertos']} aciertos / {estadisticas_cache['fallos']} fallos.")
+    exportar_excel(df, args.out)
+    _informar(f"Excel enriquecido guardado en {args.out}")
+    return 0
+
+
+def comando_assemble(args, telemetria=None):
+    import pandas as pd
+
+    from .ensamblaje import SalidaZip, ensamblar_zip, escribir_manifiesto, leer_manifiesto
+
+    df = pd.read_excel(args.excel)
+    if args.columna not in df.columns:
+        _informar(f"La columna '{args.columna}' no existe en el Excel. Opciones: {', '.join(map(str, df.columns))}")
+        return 2
+    with open(args.plantilla, "rb") as archivo:
+        plantilla = archivo.read()
+
+    base, extension = os.path.splitext(args.zip)
+    ruta_manifiesto = base + ".manifiesto.json"
+    anterior = None
+    if not args.completo:
+        anterior = leer_manifiesto(args.anterior or ruta_manifiesto)
+        if args.anterior and anterior is None:
+            _informar(f"No se pudo leer {args.anterior} o falta alguno de sus volúmenes; se ensamblan todas las fichas.")
+
+    # Todo se escribe primero en temporales: la salida nueva puede ocupar la
+    # misma ruta que los volúmenes anteriores de los que copia.
+    salida = SalidaZip(max_bytes_volumen=args.max_mb_volumen * 1024 * 1024 if args.max_mb_volumen else None)
+    volumenes = ensamblar_zip(df, plantilla, args.columna, salida, procesos=args.procesos,
+                              al_avanzar=_progreso("Ensamblaje"), anterior=anterior, telemetria=telemetria)
+    if args.max_mb_volumen:
+        rutas = [f"{base}_parte{numero:02d}{extension or '.zip'}" for numero in range(1, len(volumenes) + 1)]
+    else:
+        rutas = [args.zip]
+    for ruta, volumen in zip(rutas, volumenes):
+        with open(ruta, "wb") as destino:
+            shutil.copyfileobj(volumen, destino)
+        volumen.close()
+    escribir_manifiesto(ruta_manifiesto, salida, rutas)
+    if anterior is not None:
+        _informar(f"{salida.copiadas} ficha(s) sin cambios copiadas del ensamblaje anterior.")
+    _informar(f"{len(df)} ficha(s) en {len(volumenes)} archivo(s) .zip")
+    return 0
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(prog="ensamblador", description="Ensamblador de Fichas Técnicas con IA")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    comunes = argparse.ArgumentParser(add_help=False)
+    comunes.add_argument("--telemetria", help="Guarda tiempos, tokens y costo de la ejecución en este .json (o .csv).")
+    comunes.add_argument("--perfil", help="Guarda un perfil de cProfile en este .prof (y un resumen en .prof.txt).")
+
+    enrich = subcomandos.add_parser("enrich", parents=[comunes], help="Genera análisis y recomendaciones para un Excel de ítems.")
+    enrich.add_argument("excel", help="Excel con los datos base.")
+    enrich.add_argument("--out", required=True, help="Ruta del Excel enriquecido.")
+    enrich.add_argument("--api-key", help="Clave de Google AI (por defecto GOOGLE_API_KEY).")
+    enrich.add_argument("--columna-id", default="ItemId", help="Columna que identifica cada fila.")
+    enrich.add_argument("--concurrencia", type=int, default=CONCURRENCIA_POR_DEFECTO, help="Peticiones simultáneas.")
+    enrich.add_argument("--lote", type=int, default=1, help="Ítems por petición (modo lote si es mayor que 1).")
+    enrich.add_argument("--rpm", type=int, default=RPM_POR_DEFECTO, help="Cuota de peticiones por minuto.")
+    enrich.add_argument("--tpm", type=int, default=TPM_POR_DEFECTO, help="Cuota de tokens de entrada por minuto.")
+    enrich.add_argument("--max-tokens-prompt", type=int, default=PRESUPUESTO_TOKENS_POR_DEFECTO,
+                        help="No enviar las peticiones cuya estimación de tokens de entrada lo supere.")
+    enrich.add_argument("--prompt-analisis", default="", help="Instrucciones adicionales para el análisis.")
+    enrich.add_argument("--prompt-recomendaciones", default="", help="Instrucciones adicionales para las recomendaciones.")
+    enrich.add_argument("--sin-cache", action="store_true", help="No usar la caché de respuestas.")
+    enrich.add_argument("--refrescar-cache", action="store_true", help="Ignorar la caché al leer, pero actualizarla.")
+    enrich.add_argument("--cache-max-mb", type=float, default=MAX_MB_POR_DEFECTO)
+    enrich.add_argument("--cache-max-dias", type=float, default=MAX_DIAS_POR_DEFECTO)
+    enrich.add_argument("--sin-deduplicar", action="store_true",
+                        help="Enviar también las filas con los mismos campos de prompt que otra.")
+    enrich.add_argument("--solo-columnas-prompt", action="store_true",
+                        help="Leer solo las columnas que usan los prompts (más rápido en libros grandes).")
+    enrich.add_argument("--sin-reanudar", action="store_true", help="Ignorar los resultados guardados de ejecuciones anteriores.")
+    enrich.add_argument("--solo-errores", action="store_true",
+                        help="El Excel ya está enriquecido: regenerar solo las filas marcadas como ERROR.")
+    enrich.set_defaults(funcion=comando_enrich)
+
+    assemble = subcomandos.add_parser("assemble", parents=[comunes], help="Genera una ficha de Word por fila y las empaqueta en .zip.")
+    assemble.add_argument("excel", help="Excel enriquecido.")
+    assemble.add_argument("plantilla", help="Plantilla de Word (.docx).")
+    assemble.add_argument("--zip", required=True, help="Ruta del .zip de salida.")
+    assemble.add_argument("--columna", default="ItemId", help="Columna que da nombre a cada archivo.")
+    assemble.add_argument("--procesos", type=int, default=os.cpu_count() or 1,
+                          help="Máximo de procesos de renderizado; con pocas fichas se usa el proceso actual.")
+    assemble.add_argument("--max-mb-volumen", type=int, default=0,
+                          help="Divide la salida en volúmenes de este tamaño (MB); 0 = un solo archivo.")
+    assemble.add_argument("--anterior", help="Manifiesto de un ensamblaje previo (por defecto <zip>.manifiesto.json); "
+                                             "solo se renderizan las fichas nuevas o modificadas.")
+    assemble.add_argument("--completo", action="store_true", help="Renderizar todas las fichas aunque no hayan cambiado.")
+    assemble.set_defaults(funcion=comando_assemble)
+    return parser
+
+
+def main(argv=None, inicio=None):
+    """Punto de entrada; ``inicio`` es el ``perf_counter`` tomado antes de importar el paquete."""
+    args = crear_parser().parse_args(argv)
+    if inicio is not None:
+        _informar(f"Arranque: {(time.perf_counter() - inicio) * 1000:.0f} ms")
+    telemetria = Telemetria() if args.telemetria else None
+    with perfil(args.perfil):
+        codigo = args.funcion(args, telemetria)
+    if telemetria is not None:
+        from .modelo import PRECIO_POR_MILLON
+
+        telemetria.terminar()
+        contenido = telemetria.a_csv(PRECIO_POR_MILLON) if args.telemetria.endswith(".csv") else telemetria.a_json(PRECIO_POR_MILLON)
+        with open(args.telemetria, "w", encoding="utf-8", newline="") as archivo:
+            archivo.write(contenido)
+        _informar(f"Telemetría guardada en {args.telemetria}:")
+        _informar_telemetria(telemetria.resumen(PRECIO_POR_MILLON))
+    return codigo
@@ -0,0 +1,364 @@
+"""Ensamblaje de las fichas técnicas de Word a partir de la plantilla.
+
+La plantilla se prepara una sola vez por proceso: el documento ya leído se
+clona para cada ficha en lugar de volver a descomprimirlo y parsearlo, y el
+XML parchado por docxtpl y la plantilla Jinja compilada se reutilizan en
+todas las filas.
+El renderizado se reparte en un pool de procesos y cada documento terminado
+se escribe en el ZIP en cuanto llega; con un solo proceso cada ficha se
+guarda directamente dentro de su entrada del ZIP, sin búfer intermedio.
+
+Cada ensamblaje puede dejar un manifiesto con la huella de cada ficha (su
+contexto de renderizado más la plantilla). Con el manifiesto anterior solo
+se renderizan las filas nuevas o modificadas; las demás se copian del ZIP
+anterior tal cual, sin descomprimirlas, y las filas que ya no existen
+desaparecen de la salida.
+"""
+
+import copy
+import hashlib
+import json
+import multiprocessing
+import os
+import struct
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from io import BytesIO
+
+from docx import Document
+from docxtpl import DocxTemplate
+from jinja2 import Environment
+
+from .exportacion import UMBRAL_MEMORIA_POR_DEFECTO, archivo_temporal
+from .telemetria import NULA, Telemetria
+
+# Arrancar un proceso del pool (intérprete, imports, plantilla) cuesta unos dos
+# segundos, lo que tarda en renderizar unas 50 fichas; por debajo de este número
+# de fichas por proceso sale más barato renderizar en el proceso actual.
+FICHAS_POR_PROCESO = 100
+
+
+class _EntornoMemo(Environment):
+    """Entorno Jinja que compila cada fuente XML una sola vez."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._compiladas = {}
+
+    def from_string(self, source, globals=None, template_class=None):
+        if globals is not None or template_class is not None:
+            return super().from_string(source, globals, template_class)
+        plantilla = self._compiladas.get(source)
+        if plantilla is None:
+            plantilla = self._compiladas[source] = super().from_string(source)
+        return plantilla
+
+
+class _DocxTemplateMemo(DocxTemplate):
+    """DocxTemplate que parte de un clon del documento y reutiliza ``patch_xml``.
+
+    Sobrescribe detalles internos de docxtpl (``init_docx``, ``patch_xml``,
+    ``is_rendered``); comprobado con la versión fijada en requirements.txt.
+    """
+
+    def __init__(self, template_file, original, parches):
+        super().__init__(template_file)
+        self._original = original
+        self._parches = parches
+
+    def init_docx(self, reload=True):
+        if not self.docx or (self.is_rendered and reload):
+            self.docx = copy.deepcopy(self._original)
+            self.is_rendered = False
+
+    def patch_xml(self, src_xml):
+        parchado = self._parches.get(src_xml)
+        if parchado is None:
+            parchado = self._parches[src_xml] = super().patch_xml(src_xml)
+        return parchado
+
+
+class PlantillaCompilada:
+    """Plantilla de Word lista para renderizar muchas filas."""
+
+    def __init__(self, contenido):
+        self.contenido = bytes(contenido)
+        self._original = Document(BytesIO(self.contenido))
+        self._entorno = _EntornoMemo()
+        self._parches = {}
+
+    def renderizar(self, contexto, destino=None, telemetria=NULA):
+        """Aplica ``contexto`` y guarda el .docx en ``destino``; sin destino devuelve sus bytes."""
+        with telemetria.medir("ensamblaje.render"):
+            doc = _DocxTemplateMemo(BytesIO(self.contenido), self._original, self._parches)
+            doc.render(contexto, self._entorno)
+        with telemetria.medir("ensamblaje.guardado"):
+            if destino is not None:
+                doc.save(destino)
+                return None
+            salida = BytesIO()
+            doc.save(salida)
+            return salida.getvalue()
+
+
+def nombre_archivo(valor):
+    """Nombre del .docx de una fila a partir del valor de la columna elegida."""
+    nombre_base = str(valor).replace('/', '_').replace('\\', '_')
+    return f"{nombre_base}.docx"
+
+
+# Plantilla de cada proceso del pool; se envía una vez, en el inicializador.
+_plantilla_proceso = None
+
+
+def _iniciar_proceso(contenido):
+    global _plantilla_proceso
+    _plantilla_proceso = PlantillaCompilada(contenido)
+
+
+def _renderizar_en_proceso(contexto):
+    # Los tiempos viajan con el documento para sumarse a la telemetría del proceso principal.
+    telemetria = Telemetria()
+    return _plantilla_proceso.renderizar(contexto, telemetria=telemetria), telemetria.muestras()
+
+
+def _filas(df, columna_nombre):
+    return ((nombre_archivo(fila[columna_nombre]), fila.to_dict()) for _, fila in df.iterrows())
+
+
+def huella_ficha(contexto, huella_plantilla):
+    """Huella de una ficha: cambia si cambia su contexto de renderizado o la plantilla."""
+    texto = json.dumps(contexto, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256((huella_plantilla + texto).encode("utf-8")).hexdigest()
+
+
+def _contexto_procesos():
+    # Con ``fork`` el hijo copia un proceso con hilos (el servidor de Streamlit, las
+    # tareas) y puede heredar un lock tomado; forkserver y spawn parten de cero.
+    metodos = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in metodos else "spawn")
+
+
+def renderizar_fichas(filas, plantilla_bytes, procesos, telemetria=NULA):
+    """Genera ``(clave, bytes_docx)`` por cada ``(clave, contexto)`` de ``filas`` desde un pool de procesos.
+
+    Los resultados salen en el orden en que terminan y el número de
+    documentos en vuelo está acotado, así que la memoria no crece con el
+    tamaño del banco.
+    """
+    def terminado(futuro):
+        contenido, tiempos = futuro.result()
+        telemetria.combinar(tiempos)
+        return contenido
+
+    en_vuelo = {}
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=_contexto_procesos(), initializer=_iniciar_proceso,
+                             initargs=(bytes(plantilla_bytes),)) as executor:
+        for nombre, contexto in filas:
+            if len(en_vuelo) >= procesos * 2:
+                listos, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                for futuro in listos:
+                    yield en_vuelo.pop(futuro), terminado(futuro)
+            en_vuelo[executor.submit(_renderizar_en_proceso, contexto)] = nombre
+        while en_vuelo:
+            listos, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+            for futuro in listos:
+                yield en_vuelo.pop(futuro), terminado(futuro)
+
+
+class SalidaZip:
+    """Destino del ensamblaje: un ZIP o una serie de volúmenes de tamaño acotado.
+
+    Sin ``destino`` cada volumen es un archivo temporal que se vuelca a disco
+    al superar ``umbral_memoria``. Con ``max_bytes_volumen`` se abre un
+    volumen nuevo antes de la ficha que haría pasar el actual de ese tamaño.
+    """
+
+    def __init__(self, destino=None, umbral_memoria=UMBRAL_MEMORIA_POR_DEFECTO, max_bytes_volumen=None):
+        if destino is not None and max_bytes_volumen:
+            raise ValueError("Un destino fijo no admite dividir la salida en volúmenes.")
+        self._destino = destino
+        self.umbral_memoria = umbral_memoria
+        self.max_bytes_volumen = max_bytes_volumen
+        self.volumenes = []
+        # {nombre: {"huella", "volumen"}} de las fichas escritas, para el manifiesto.
+        self.fichas = {}
+        self.copiadas = 0
+        self._zip = None
+        self._docs_volumen = 0
+        self._ultimo_tamano = 0
+
+    def _tamano(self):
+        return self._zip.fp.tell()
+
+    def _preparar(self, estimado):
+        excede = (self.max_bytes_volumen and self._docs_volumen
+                  and self._tamano() + estimado > self.max_bytes_volumen)
+        if self._zip is not None and not excede:
+            return
+        if self._zip is not None:
+            self._zip.close()
+        archivo = self._destino if self._destino is not None else archivo_temporal(self.umbral_memoria)
+        self.volumenes.append(archivo)
+        self._zip = zipfile.ZipFile(archivo, "w", zipfile.ZIP_DEFLATED, False)
+        self._docs_volumen = 0
+
+    def _registrar(self, nombre, huella):
+        self._docs_volumen += 1
+        if huella is not None:
+            self.fichas[nombre] = {"huella": huella, "volumen": len(self.volumenes) - 1}
+
+    def agregar(self, nombre, contenido, huella=None):
+        self._preparar(len(contenido))
+        self._zip.writestr(nombre, contenido)
+        self._ultimo_tamano = len(contenido)
+        self._registrar(nombre, huella)
+
+    @contextmanager
+    def entrada(self, nombre, huella=None):
+        """Entrada del ZIP abierta para escritura; su tamaño se estima con la ficha anterior."""
+        self._preparar(self._ultimo_tamano)
+        inicio = self._tamano()
+        with self._zip.open(nombre, "w") as archivo:
+            yield archivo
+        self._ultimo_tamano = self._tamano() - inicio
+        self._registrar(nombre, huella)
+
+    def copiar(self, origen, nombre, huella=None):
+        """Copia la entrada ``nombre`` del ZIP abierto ``origen`` sin descomprimirla ni recomprimirla."""
+        info = origen.getinfo(nombre)
+        self._preparar(info.compress_size)
+        _copiar_en_crudo(origen, info, self._zip)
+        self._ultimo_tamano = info.compress_size
+        self.copiadas += 1
+        self._registrar(nombre, huella)
+
+    def cerrar(self):
+        """Cierra el volumen abierto y devuelve todos, posicionados al inicio."""
+        if self._zip is None:
+            self._preparar(0)
+        self._zip.close()
+        for volumen in self.volumenes:
+            if hasattr(volumen, "seek"):
+                volumen.seek(0)
+        return self.volumenes
+
+
+def _copiar_en_crudo(origen, info, destino):
+    # zipfile no ofrece copiar una entrada comprimida: se leen los datos que
+    # siguen a su cabecera local y se escriben tras una cabecera nueva, igual
+    # que hace ZipFile al abrir una entrada para escritura.
+    origen.fp.seek(info.header_offset)
+    cabecera = origen.fp.read(zipfile.sizeFileHeader)
+    largo_nombre, largo_extra = struct.unpack("<HH", cabecera[26:30])
+    origen.fp.seek(info.header_offset + zipfile.sizeFileHeader + largo_nombre + largo_extra)
+    datos = origen.fp.read(info.compress_size)
+
+    nueva = copy.copy(info)
+    # Sin descriptor de datos: el CRC y los tamaños ya se conocen y van en la cabecera.
+    nueva.flag_bits &= ~0x08
+    with destino._lock:
+        destino._writecheck(nueva)
+        destino.fp.seek(destino.start_dir)
+        nueva.header_offset = destino.fp.tell()
+        destino.fp.write(nueva.FileHeader())
+        destino.fp.write(datos)
+        destino.filelist.append(nueva)
+        destino.NameToInfo[nueva.filename] = nueva
+        destino.start_dir = destino.fp.tell()
+        destino._didModify = True
+
+
+def escribir_manifiesto(ruta, salida, rutas_volumenes):
+    """Guarda en ``ruta`` la huella y el volumen de cada ficha de ``salida``.
+
+    ``rutas_volumenes`` son las rutas finales de los volúmenes, en orden; se
+    guardan relativas a la carpeta del manifiesto.
+    """
+    carpeta = os.path.dirname(os.path.abspath(ruta))
+    datos = {
+        "volumenes": [os.path.relpath(os.path.abspath(volumen), carpeta) for volumen in rutas_volumenes],
+        "fichas": salida.fichas,
+    }
+    with open(ruta, "w", encoding="utf-8") as archivo:
+        json.dump(datos, archivo, ensure_ascii=False)
+
+
+def leer_manifiesto(ruta):
+    """Manifiesto de un ensamblaje anterior, o None si falta él o alguno de sus volúmenes."""
+    try:
+        with open(ruta, encoding="utf-8") as archivo:
+            datos = json.load(archivo)
+    except (OSError, ValueError):
+        return None
+    carpeta = os.path.dirname(os.path.abspath(ruta))
+    datos["volumenes"] = [os.path.join(carpeta, volumen) for volumen in datos.get("volumenes", [])]
+    if not all(os.path.exists(volumen) for volumen in datos["volumenes"]):
+        return None
+    return datos
+
+
+def ensamblar_zip(df, plantilla_bytes, columna_nombre, destino, procesos=None, al_avanzar=None, anterior=None,
+                  telemetria=None):
+    """Escribe una ficha por fila en ``destino``: una :class:`SalidaZip` o una ruta/archivo.
+
+    Con ``procesos`` igual a 1 todo ocurre en el proceso actual y cada ficha
+    se guarda directamente en el ZIP; nunca se usan más procesos que uno por
+    cada :data:`FICHAS_POR_PROCESO` filas, así un libro pequeño no paga el
+    arranque del pool. Con ``anterior`` (de
+    :func:`leer_manifiesto`) las fichas cuya huella no cambió se copian de
+    los volúmenes anteriores en lugar de renderizarse. ``al_avanzar(hechos,
+    total)`` se llama tras añadir cada documento y ``telemetria`` recibe los
+    tiempos de renderizado, guardado y copia de cada ficha. Devuelve la
+    lista de volúmenes escritos.
+    """
+    telemetria = telemetria or NULA
+    salida = destino if isinstance(destino, SalidaZip) else SalidaZip(destino)
+    procesos = max(1, min(procesos or os.cpu_count() or 1, len(df) // FICHAS_POR_PROCESO))
+    huella_plantilla = hashlib.sha256(plantilla_bytes).hexdigest()
+    previas = anterior["fichas"] if anterior else {}
+    origenes = {}
+    total_docs = len(df)
+    hechos = 0
+
+    def avanzar():
+        nonlocal hechos
+        hechos += 1
+        if al_avanzar:
+            al_avanzar(hechos, total_docs)
+
+    def por_renderizar():
+        # Copia al vuelo las fichas sin cambios y entrega solo las que hay que renderizar.
+        for nombre, contexto in _filas(df, columna_nombre):
+            huella = huella_ficha(contexto, huella_plantilla)
+            previa = previas.get(nombre)
+            if previa is not None and previa["huella"] == huella:
+                numero = previa["volumen"]
+                if numero not in origenes:
+                    origenes[numero] = zipfile.ZipFile(anterior["volumenes"][numero])
+                with telemetria.medir("ensamblaje.copia"):
+                    salida.copiar(origenes[numero], nombre, huella)
+                avanzar()
+            else:
+                yield (nombre, huella), contexto
+
+    try:
+        if procesos <= 1:
+            plantilla = None
+            for (nombre, huella), contexto in por_renderizar():
+                if plantilla is None:
+                    # Solo se prepara si hay algo que renderizar.
+                    plantilla = PlantillaCompilada(plantilla_bytes)
+                with salida.entrada(nombre, huella) as archivo:
+                    plantilla.renderizar(contexto, archivo, telemetria)
+                avanzar()
+        else:
+            for (nombre, huella), contenido in renderizar_fichas(por_renderizar(), plantilla_bytes, procesos, telemetria):
+                with telemetria.medir("ensamblaje.zip"):
+                    salida.agregar(nombre, contenido, huella)
+                avanzar()
+    finally:
+        for origen in origenes.values():
+            origen.close()
+    return salida.cerrar()
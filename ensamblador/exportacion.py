@@ -0,0 +1,46 @@
+"""Exportaciones con memoria acotada.
+
+Los archivos de salida se escriben en ``SpooledTemporaryFile``: permanecen
+en memoria mientras son pequeños y pasan a disco al superar el umbral, así
+el consumo no crece con el tamaño del banco de ítems. ``st.download_button``
+no acepta estos archivos: hay que pasarle sus bytes (``.read()``) o un
+archivo abierto en disco con ``open(ruta, "rb")``.
+"""
+
+import math
+import tempfile
+
+from openpyxl import Workbook
+
+UMBRAL_MEMORIA_POR_DEFECTO = 8 * 1024 * 1024
+
+
+def archivo_temporal(umbral_memoria=UMBRAL_MEMORIA_POR_DEFECTO):
+    """Archivo binario que se vuelca a disco al pasar de ``umbral_memoria`` bytes."""
+    return tempfile.SpooledTemporaryFile(max_size=umbral_memoria, mode="w+b")
+
+
+def _celda(valor):
+    # openpyxl no acepta NaN/NaT: las celdas vacías se escriben como None.
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return None
+    if hasattr(valor, "to_pydatetime"):
+        return None if valor != valor else valor.to_pydatetime()
+    return valor
+
+
+def exportar_excel(df, destino=None, umbral_memoria=UMBRAL_MEMORIA_POR_DEFECTO):
+    """Escribe ``df`` como .xlsx fila a fila (openpyxl en modo ``write_only``).
+
+    Devuelve ``destino`` (o un archivo temporal nuevo) posicionado al inicio.
+    """
+    destino = destino if destino is not None else archivo_temporal(umbral_memoria)
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet("Datos Enriquecidos")
+    hoja.append([str(columna) for columna in df.columns])
+    for fila in df.itertuples(index=False, name=None):
+        hoja.append([_celda(valor) for valor in fila])
+    libro.save(destino)
+    if hasattr(destino, "seek"):
+        destino.seek(0)
+    return destino
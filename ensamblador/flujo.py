@@ -0,0 +1,147 @@
+"""Enriquecimiento de un DataFrame de ítems, sin dependencias de interfaz.
+
+La aplicación de Streamlit y la línea de comandos llaman a este mismo flujo;
+cada una solo aporta su forma de mostrar el progreso.
+"""
+
+from dataclasses import dataclass
+
+from .bitacora import Bitacora, identidades
+from .cache import MAX_DIAS_POR_DEFECTO, MAX_MB_POR_DEFECTO, CacheRespuestas
+from .limitador import RPM_POR_DEFECTO, TPM_POR_DEFECTO, Limitador
+from .lotes import instrucciones_lote, insumos_items
+from .modelo import FIRMA_MODELO
+from .motor import (
+    ANALISIS,
+    CONCURRENCIA_POR_DEFECTO,
+    RECOMENDACIONES,
+    Trabajo,
+    aplicar_resultados,
+    enriquecer,
+    enriquecer_en_lotes,
+)
+from .planificacion import planificar, propagar
+from .prompts import PLANTILLA_ANALISIS, PLANTILLA_RECOMENDACIONES, PRESUPUESTO_TOKENS_POR_DEFECTO
+from .telemetria import NULA
+
+PLANTILLAS = {ANALISIS: PLANTILLA_ANALISIS, RECOMENDACIONES: PLANTILLA_RECOMENDACIONES}
+
+
+@dataclass
+class Configuracion:
+    """Parámetros de una ejecución de enriquecimiento."""
+    columna_id: str = "ItemId"
+    max_concurrencia: int = CONCURRENCIA_POR_DEFECTO
+    tam_lote: int = 1
+    rpm: int = RPM_POR_DEFECTO
+    tpm: int = TPM_POR_DEFECTO
+    prompt_adicional_analisis: str = ""
+    prompt_adicional_recomendaciones: str = ""
+    usar_cache: bool = True
+    omitir_cache: bool = False
+    cache_max_mb: float = MAX_MB_POR_DEFECTO
+    cache_max_dias: float = MAX_DIAS_POR_DEFECTO
+    # Enviar una sola vez cada prompt repetido y copiar su resultado.
+    deduplicar: bool = True
+    # Tokens estimados por petición (instrucciones más insumos); las que lo superan no se envían.
+    max_tokens_prompt: int = PRESUPUESTO_TOKENS_POR_DEFECTO
+
+
+def todas_las_filas(df):
+    return {ANALISIS: list(df.index), RECOMENDACIONES: list(df.index)}
+
+
+def pendientes_efectivos(pendientes, config):
+    """Filas que realmente se enviarán por tipo.
+
+    En modo lote cada ítem pendiente regenera sus cinco columnas en una sola
+    petición, así que ambos tipos cubren las mismas filas.
+    """
+    if config.tam_lote > 1:
+        filas = sorted(set(pendientes.get(ANALISIS, [])) | set(pendientes.get(RECOMENDACIONES, [])))
+        return {ANALISIS: filas, RECOMENDACIONES: filas}
+    return {tipo: list(pendientes.get(tipo, [])) for tipo in (ANALISIS, RECOMENDACIONES)}
+
+
+def _adicional_lote(config):
+    # En modo lote una sola instrucción cubre ambos tipos de prompt.
+    return "\n".join(p for p in (config.prompt_adicional_analisis, config.prompt_adicional_recomendaciones) if p)
+
+
+def firma_ejecucion(config):
+    """Lo que determina las respuestas de una ejecución: modelo, instrucciones, insumos y tamaño de lote.
+
+    Identifica la bitácora junto con el libro de Excel, para no reanudar con
+    resultados generados por otros prompts.
+    """
+    if config.tam_lote > 1:
+        instrucciones = {"lote": instrucciones_lote(_adicional_lote(config))}
+        insumos = {}
+    else:
+        adicionales = {ANALISIS: config.prompt_adicional_analisis, RECOMENDACIONES: config.prompt_adicional_recomendaciones}
+        instrucciones = {tipo: plantilla.sistema(adicionales[tipo]) for tipo, plantilla in PLANTILLAS.items()}
+        insumos = {tipo: plantilla.insumos for tipo, plantilla in PLANTILLAS.items()}
+    return {"modelo": FIRMA_MODELO, "tam_lote": config.tam_lote, "instrucciones": instrucciones, "insumos": insumos}
+
+
+def planificar_ejecucion(df, pendientes, config):
+    """:class:`~ensamblador.planificacion.Plan` con lo que se enviará para ``pendientes``."""
+    pendientes = pendientes_efectivos(todas_las_filas(df) if pendientes is None else pendientes, config)
+    return planificar(df, pendientes, config.tam_lote, config.deduplicar)
+
+
+def enriquecer_dataframe(model, df, config, pendientes=None, ruta_bitacora=None, al_completar=None, plan=None,
+                         telemetria=None):
+    """Genera análisis y recomendaciones para ``pendientes`` ({tipo: índices}) y los escribe en ``df``.
+
+    Sin ``pendientes`` se procesan todas las filas. ``plan`` es el resultado
+    de :func:`planificar_ejecucion`, si ya se calculó para mostrarlo; solo se
+    envían sus representantes y ``al_completar`` cuenta sobre ellos. Con
+    ``ruta_bitacora`` cada resultado se guarda en cuanto llega y con
+    ``telemetria`` se mide cada llamada. Devuelve
+    ``(df, estadisticas_cache)``, donde la segunda es ``{"aciertos", "fallos"}``
+    o None si no hubo caché.
+    """
+    if plan is None:
+        plan = planificar_ejecucion(df, pendientes, config)
+    pendientes = plan.envios
+    ids = identidades(df, config.columna_id)
+    telemetria = telemetria or NULA
+    if config.tam_lote > 1:
+        with telemetria.medir("prompt.construccion"):
+            insumos = insumos_items(df, pendientes[ANALISIS])
+        items = [(i, ids[i], insumos[i]) for i in pendientes[ANALISIS]]
+    else:
+        # Ambos tipos de prompt van al mismo pool; cada resultado vuelve a su fila.
+        # Las instrucciones se arman una vez por tipo y por fila solo se rellenan los insumos.
+        adicionales = {ANALISIS: config.prompt_adicional_analisis, RECOMENDACIONES: config.prompt_adicional_recomendaciones}
+        trabajos = []
+        for tipo, plantilla in PLANTILLAS.items():
+            sistema = plantilla.sistema(adicionales[tipo])
+            with telemetria.medir("prompt.construccion"):
+                prompts = plantilla.rellenar(df, pendientes[tipo])
+            trabajos.extend(Trabajo(i, tipo, prompt, ids[i], sistema=sistema) for i, prompt in prompts.items())
+
+    limitador = Limitador(rpm=config.rpm, tpm=config.tpm)
+    cache = None
+    if config.usar_cache:
+        cache = CacheRespuestas(max_mb=config.cache_max_mb, max_dias=config.cache_max_dias, leer=not config.omitir_cache)
+    bitacora = Bitacora(ruta_bitacora) if ruta_bitacora else None
+    estadisticas_cache = None
+    try:
+        opciones_motor = dict(limitador=limitador, cache=cache, firma_modelo=FIRMA_MODELO, bitacora=bitacora,
+                              max_tokens_prompt=config.max_tokens_prompt, telemetria=telemetria)
+        if config.tam_lote > 1:
+            resultados = enriquecer_en_lotes(model, items, config.tam_lote, config.max_concurrencia, al_completar,
+                                             prompt_adicional=_adicional_lote(config), **opciones_motor)
+        else:
+            resultados = enriquecer(model, trabajos, config.max_concurrencia, al_completar, **opciones_motor)
+        propagar(resultados, plan, ids, bitacora)
+    finally:
+        if cache is not None:
+            estadisticas_cache = {"aciertos": cache.aciertos, "fallos": cache.fallos}
+            cache.cerrar()
+        if bitacora is not None:
+            bitacora.cerrar()
+    aplicar_resultados(df, resultados)
+    return df, estadisticas_cache
@@ -0,0 +1,100 @@
+"""Control de cuota para las llamadas a Gemini.
+
+Un cubo de tokens por cada presupuesto (peticiones y tokens por minuto)
+marca el ritmo real permitido por la cuota, y los errores transitorios
+(429 y 5xx) se reintentan con espera exponencial y jitter. Los bloqueos de
+seguridad y las peticiones inválidas se consideran definitivos.
+"""
+
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+RPM_POR_DEFECTO = 60
+TPM_POR_DEFECTO = 1_000_000
+
+
+def estimar_tokens(texto):
+    """Estimación barata de tokens de entrada (~4 caracteres por token)."""
+    return max(1, len(texto) // 4)
+
+
+class CuboDeTokens:
+    """Cubo de tokens con capacidad de un minuto de cuota.
+
+    Las reservas pueden dejar el saldo en negativo: quien reserva recibe el
+    tiempo que debe esperar, así los hilos quedan en fila sin sondear.
+    """
+
+    def __init__(self, por_minuto):
+        self.capacidad = float(por_minuto)
+        self._tasa = por_minuto / 60.0
+        self._disponibles = self.capacidad
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reservar(self, cantidad=1):
+        """Descuenta ``cantidad`` y devuelve los segundos que hay que esperar."""
+        with self._lock:
+            ahora = time.monotonic()
+            self._disponibles = min(self.capacidad, self._disponibles + (ahora - self._ultimo) * self._tasa)
+            self._ultimo = ahora
+            self._disponibles -= min(float(cantidad), self.capacidad)
+            if self._disponibles >= 0:
+                return 0.0
+            return -self._disponibles / self._tasa
+
+
+class Limitador:
+    """Aplica a la vez los presupuestos de peticiones y de tokens por minuto."""
+
+    def __init__(self, rpm=RPM_POR_DEFECTO, tpm=TPM_POR_DEFECTO):
+        self._peticiones = CuboDeTokens(rpm)
+        self._tokens = CuboDeTokens(tpm)
+
+    def esperar(self, tokens):
+        espera = max(self._peticiones.reservar(1), self._tokens.reservar(tokens))
+        if espera > 0:
+            time.sleep(espera)
+
+
+def es_reintentable(error):
+    """True para límites de cuota (429), fallos del servidor (5xx) y cortes de red."""
+    # Las excepciones de google.api_core exponen el estado HTTP en ``code``.
+    codigo = getattr(error, "code", None)
+    if isinstance(codigo, int):
+        return codigo == 429 or codigo >= 500
+    return isinstance(error, (TimeoutError, ConnectionError))
+
+
+@dataclass
+class PoliticaReintentos:
+    """Reintentos con espera exponencial y jitter completo."""
+    max_reintentos: int = 5
+    espera_base: float = 1.0
+    espera_maxima: float = 60.0
+
+    def ejecutar(self, funcion, limitador=None, tokens=1, telemetria=None):
+        """Llama ``funcion`` respetando ``limitador`` y reintentando errores transitorios.
+
+        Con ``telemetria`` se anotan las esperas por cuota y por reintento.
+        """
+        intento = 0
+        while True:
+            if limitador is not None:
+                inicio = time.perf_counter()
+                limitador.esperar(tokens)
+                if telemetria is not None:
+                    telemetria.observar("espera.cuota", time.perf_counter() - inicio)
+            try:
+                return funcion()
+            except Exception as e:
+                if intento >= self.max_reintentos or not es_reintentable(e):
+                    raise
+                espera = random.uniform(0, min(self.espera_maxima, self.espera_base * 2 ** intento))
+                if telemetria is not None:
+                    telemetria.sumar("api.reintentos")
+                    telemetria.observar("espera.reintento", espera)
+                time.sleep(espera)
+                intento += 1
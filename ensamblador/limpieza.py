@@ -0,0 +1,88 @@
+"""Lectura del Excel de ítems y limpieza del HTML de sus celdas.
+
+La limpieza recorre en Python las celdas de texto de cada columna. Una
+columna sin ``<`` ni ``&`` en ninguna celda se devuelve tal cual, sin
+copiarla; en las demás, cada celda pasa por la expresión de etiquetas solo
+si contiene ``<`` y por ``html.unescape`` solo si contiene ``&``. Solo se
+quitan etiquetas reales (``<p>``, ``</b>``, ``<br/>``), así que un texto
+como "x < 5 y y > 2" se conserva. Para libros muy grandes se pueden leer
+solo las columnas necesarias con openpyxl en modo de solo lectura, sin
+materializar el resto del libro.
+"""
+
+import html
+import re
+
+import pandas as pd
+
+from .telemetria import NULA
+
+# Una etiqueta empieza por una letra tras ``<`` o ``</``; así no se borran comparaciones.
+_ETIQUETA = re.compile(r"</?[A-Za-z][^>]*>")
+
+
+def limpiar_html(texto_html):
+    """Quita las etiquetas HTML de un texto y decodifica sus entidades (``&nbsp;``, ``&aacute;``...)."""
+    if not isinstance(texto_html, str):
+        return texto_html
+    texto_limpio = _ETIQUETA.sub('', texto_html) if '<' in texto_html else texto_html
+    if '&' in texto_limpio:
+        texto_limpio = html.unescape(texto_limpio).replace('\xa0', ' ')
+    return texto_limpio
+
+
+def limpiar_columna(serie):
+    """Aplica :func:`limpiar_html` a cada celda de una columna.
+
+    Solo se tocan las columnas de texto (``object`` o ``string``); los valores
+    que no son texto (números, fechas, vacíos) se conservan. Si ninguna celda
+    tiene ``<`` ni ``&`` la columna se devuelve sin copiarla.
+    """
+    if not (pd.api.types.is_object_dtype(serie) or pd.api.types.is_string_dtype(serie)):
+        return serie
+    valores = serie.tolist()
+    if not any(isinstance(valor, str) and ('<' in valor or '&' in valor) for valor in valores):
+        return serie
+    return pd.Series([limpiar_html(valor) for valor in valores], index=serie.index, dtype=serie.dtype, name=serie.name)
+
+
+def _leer_columnas(archivo_excel, columnas):
+    """Lee solo ``columnas`` de la primera hoja, fila a fila, con openpyxl en modo solo lectura."""
+    from openpyxl import load_workbook
+
+    libro = load_workbook(archivo_excel, read_only=True, data_only=True)
+    try:
+        filas = libro.worksheets[0].iter_rows(values_only=True)
+        encabezado = next(filas, ())
+        posiciones = [(i, nombre) for i, nombre in enumerate(encabezado) if nombre in columnas]
+        datos = {nombre: [] for _, nombre in posiciones}
+        for fila in filas:
+            if fila is None or all(valor is None for valor in fila):
+                continue
+            for i, nombre in posiciones:
+                datos[nombre].append(fila[i] if i < len(fila) else None)
+    finally:
+        libro.close()
+    return pd.DataFrame(datos)
+
+
+def leer_excel_limpio(archivo_excel, columnas=None, telemetria=None, sin_limpiar=()):
+    """Lee el Excel de ítems y limpia el HTML de sus columnas de texto.
+
+    Con ``columnas`` solo se leen esas columnas (las que no existan se
+    ignoran); el resto del libro no llega a cargarse en memoria. Las de
+    ``sin_limpiar`` se leen siempre y tal cual, p. ej. las ya generadas de
+    un Excel enriquecido. Con ``telemetria`` se anotan por separado la
+    lectura y la limpieza.
+    """
+    telemetria = telemetria or NULA
+    with telemetria.medir("ingesta.lectura"):
+        if columnas:
+            df = _leer_columnas(archivo_excel, set(columnas) | set(sin_limpiar))
+        else:
+            df = pd.read_excel(archivo_excel)
+    with telemetria.medir("ingesta.limpieza"):
+        for col in df.columns:
+            if col not in sin_limpiar:
+                df[col] = limpiar_columna(df[col])
+    return df
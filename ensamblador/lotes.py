@@ -0,0 +1,139 @@
+"""Modo lote: varios ítems por petición con salida JSON validada.
+
+Las instrucciones estáticas (rol, criterio cognitivo y reglas de formato) van
+como instrucción de sistema y cada petición lleva solo los insumos de ``k``
+ítems; la respuesta es un arreglo JSON con los cinco campos de cada ítem. Lo
+que no supera la validación se devuelve como fallido para reintentarlo ítem
+por ítem.
+"""
+
+import json
+import re
+
+from .prompts import con_adicionales, leer_insumos
+
+# Campo del JSON -> columna del Excel enriquecido.
+CAMPOS_LOTE = {
+    "que_evalua": "Que_Evalua",
+    "justificacion_correcta": "Justificacion_Correcta",
+    "analisis_distractores": "Analisis_Distractores",
+    "recomendacion_fortalecer": "Recomendacion_Fortalecer",
+    "recomendacion_avanzar": "Recomendacion_Avanzar",
+}
+
+# Encabezado que precede al arreglo JSON de ítems dentro del prompt.
+ENCABEZADO_ITEMS = "🧠 ÍTEMS DE ENTRADA\n"
+
+# Pide al modelo JSON puro; se suma a la generation_config del modelo.
+OPCIONES_GENERACION = {"generation_config": {"response_mime_type": "application/json"}}
+
+# Columnas del Excel -> nombre con el que se presentan al modelo.
+_INSUMOS = [
+    ("ItemContexto", "texto_fragmento", "No aplica"),
+    ("Pregunta", "descripcion_item", "No aplica"),
+    ("Imagen_pregunta", "imagen_asociada", "No aplica"),
+    ("ComponenteNombre", "componente", "No aplica"),
+    ("CompetenciaNombre", "competencia", ""),
+    ("AfirmacionNombre", "aprendizaje_priorizado", ""),
+    ("EvidenciaNombre", "evidencia_aprendizaje", ""),
+    ("ItemGradoId", "grado_escolar", ""),
+    ("OpcionA", "opcion_a", ""),
+    ("OpcionB", "opcion_b", ""),
+    ("OpcionC", "opcion_c", ""),
+    ("OpcionD", "opcion_d", ""),
+    ("AlternativaClave", "respuesta_correcta", ""),
+]
+# Columnas del Excel que lee un ítem en modo lote.
+CAMPOS_INSUMOS = [columna for columna, _, _ in _INSUMOS]
+
+INSTRUCCIONES_LOTE = """
+🎯 ROL DEL SISTEMA
+Eres un experto en evaluación educativa con un profundo conocimiento de la pedagogía urbana, especializado en enseñanza de las matemáticas y procesos cognitivos en el contexto educativo de Bogotá. Para CADA ítem de la lista de entrada debes producir un análisis tripartito y dos recomendaciones pedagógicas (una para Fortalecer y otra para Avanzar). Trata cada ítem de forma independiente.
+
+📝 INSTRUCCIONES PARA EL ANÁLISIS DEL ÍTEM
+1. que_evalua: frase concisa (máximo 2 renglones) basada en la Competencia, el Aprendizaje Priorizado y la Evidencia. Debe comenzar obligatoriamente con "El ítem evalúa la capacidad del estudiante para...".
+2. justificacion_correcta: párrafo continuo e impersonal con el paso a paso lógico y cognitivo para llegar a la respuesta correcta, basado en los verbos del CRITERIO COGNITIVO. No utilices listas.
+3. analisis_distractores: para cada una de las TRES opciones no válidas, una línea con el formato "- El estudiante podría escoger la [OpcionX] porque [razonamiento erróneo]. Sin embargo, esto es incorrecto porque [razón]."
+
+📝 INSTRUCCIONES PARA LAS RECOMENDACIONES
+Redacta de forma impersonal, sin nombrar al docente ni al estudiante. Las actividades deben ser novedosas, creativas y centradas en el concepto matemático, con logística sencilla, y la de Fortalecer debe ser fundamentalmente diferente a la de Avanzar. Ajusta la complejidad a la edad del grado (grado 3: 9 a 11 años; grado 6: 11 a 13 años; grado 9: 13 a 15 años).
+4. recomendacion_fortalecer: refuerza los procesos cognitivos básicos del ítem atacando la raíz del error más común de las opciones no válidas, con verbos de menor complejidad.
+5. recomendacion_avanzar: complejiza el aprendizaje (progresar en el tipo de número, ampliar el objeto matemático o avanzar en las operaciones intelectuales) con verbos de mayor complejidad e incluye varias vías de transferencia.
+Cada recomendación sigue esta estructura:
+RECOMENDACIÓN PARA [FORTALECER/AVANZAR] EL APRENDIZAJE EVALUADO EN EL ÍTEM
+Para [fortalecer/avanzar] en la habilidad de [verbo clave] en situaciones relacionadas con [frase del aprendizaje priorizado], se sugiere [descripción concreta de la sugerencia].
+Una actividad que se puede hacer es: [Descripción detallada de la actividad].
+Las preguntas orientadoras para esta actividad, entre otras, pueden ser:
+- [Pregunta 1] ... - [Pregunta 5]
+
+📘 CRITERIO COGNITIVO PARA MATEMÁTICAS
+1. Interpretación y Comunicación (Comprender y representar información)
+Verbos de menor complejidad (FORTALECER): identificar, leer (datos, gráficos), reconocer, nombrar, contar, localizar, señalar.
+Verbos de mayor complejidad (AVANZAR): representar (en gráficos, tablas), describir, comparar, clasificar, organizar, traducir (de lenguaje verbal a matemático).
+
+2. Formulación y Solución de Problemas (Aplicar procedimientos y estrategias)
+Verbos de menor complejidad (FORTALECER): calcular, medir, aplicar (una fórmula), resolver (operaciones directas), completar (secuencias), usar (un algoritmo).
+Verbos de mayor complejidad (AVANZAR): formular (un plan o ecuación), plantear, modelar, diseñar (una estrategia), optimizar, descomponer (un problema).
+
+3. Argumentación (Justificar y validar procesos y resultados)
+Verbos de menor complejidad (FORTALECER): verificar, explicar (los pasos), mostrar, relacionar, ejemplificar.
+Verbos de mayor complejidad (AVANZAR): justificar (un método), validar (un resultado), probar, generalizar, demostrar, evaluar (la pertinencia de una solución).
+
+✍️ FORMATO DE SALIDA
+**REGLA CRÍTICA:** Responde ÚNICAMENTE con un arreglo JSON, sin texto adicional, con un objeto por ítem de entrada:
+[{"id": "<id del ítem>", "que_evalua": "...", "justificacion_correcta": "...", "analisis_distractores": "...", "recomendacion_fortalecer": "...", "recomendacion_avanzar": "..."}]
+Usa exactamente el "id" recibido y no omitas ningún ítem ni ningún campo.
+"""
+
+
+def insumos_items(df, indices):
+    """``{índice: insumos}`` con los campos que se envían al modelo por cada ítem de ``indices``."""
+    indices = list(indices)
+    nombres = [nombre for _, nombre, _ in _INSUMOS]
+    columnas = leer_insumos(df, indices, _INSUMOS)
+    return {indice: dict(zip(nombres, map(str, valores))) for indice, valores in zip(indices, zip(*columnas))}
+
+
+def instrucciones_lote(prompt_adicional=""):
+    """Instrucción de sistema del modo lote, con las instrucciones del usuario si las hay."""
+    return con_adicionales(INSTRUCCIONES_LOTE.strip(), prompt_adicional)
+
+
+def construir_prompt_lote(items):
+    """Prompt para una lista de ``(id, insumos)``; las instrucciones van en :func:`instrucciones_lote`."""
+    entrada = [{"id": str(id_item), **insumos} for id_item, insumos in items]
+    return ENCABEZADO_ITEMS + json.dumps(entrada, ensure_ascii=False, indent=1)
+
+
+_CERCO = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def parsear_lote(texto, ids_esperados):
+    """Valida la respuesta JSON de un lote.
+
+    Devuelve ``(validos, fallidos)``: ``{id: {columna: valor}}`` con los ítems
+    que cumplen el esquema y el conjunto de ids que hay que reintentar.
+    """
+    esperados = {str(i) for i in ids_esperados}
+    try:
+        datos = json.loads(_CERCO.sub("", texto.strip()))
+    except ValueError:
+        return {}, esperados
+    if isinstance(datos, dict):
+        datos = [datos]
+    if not isinstance(datos, list):
+        return {}, esperados
+
+    validos = {}
+    for objeto in datos:
+        if not isinstance(objeto, dict) or str(objeto.get("id")) not in esperados:
+            continue
+        valores = {}
+        for campo, columna in CAMPOS_LOTE.items():
+            valor = objeto.get(campo)
+            if not isinstance(valor, str) or not valor.strip():
+                break
+            valores[columna] = valor.strip()
+        else:
+            validos[str(objeto["id"])] = valores
+    return validos, esperados - set(validos)
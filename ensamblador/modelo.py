@@ -0,0 +1,53 @@
+"""Configuración del modelo de Gemini.
+
+El SDK de Google se importa al crear el modelo, no al importar el módulo,
+para que la interfaz y la línea de comandos arranquen sin pagar su costo.
+"""
+
+NOMBRE_MODELO = "gemini-1.5-pro-latest"
+GENERATION_CONFIG = {
+    "temperature": 0.6, "top_p": 1, "top_k": 1, "max_output_tokens": 8192
+}
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+]
+# Tarifa en dólares por millón de tokens (prompts de hasta 128k), para estimar el costo
+# de una ejecución en la telemetría. Ajústala si cambia el modelo o su precio.
+PRECIO_POR_MILLON = {"entrada": 1.25, "salida": 5.00}
+# Identifica las respuestas en la caché: si cambia el modelo o su configuración, no se reutilizan.
+FIRMA_MODELO = {"modelo": NOMBRE_MODELO, "generation_config": GENERATION_CONFIG}
+
+
+def setup_model(api_key):
+    """Crea el ``GenerativeModel``; los errores de configuración se propagan."""
+    import google.generativeai as genai
+
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(
+        model_name=NOMBRE_MODELO,
+        generation_config=GENERATION_CONFIG,
+        safety_settings=SAFETY_SETTINGS
+    )
+
+
+def con_instrucciones(model, instrucciones):
+    """Modelo igual a ``model`` que envía ``instrucciones`` como instrucción de sistema.
+
+    Las instrucciones fijas de un prompt viajan así aparte de los insumos de
+    cada ítem; el motor crea uno por ejecución y tipo de prompt. Los modelos
+    que no son de Gemini (p. ej. el simulado) aportan su propio
+    ``con_instrucciones``.
+    """
+    if hasattr(model, "con_instrucciones"):
+        return model.con_instrucciones(instrucciones)
+    import google.generativeai as genai
+
+    return genai.GenerativeModel(
+        model_name=model.model_name,
+        generation_config=GENERATION_CONFIG,
+        safety_settings=SAFETY_SETTINGS,
+        system_instruction=instrucciones,
+    )
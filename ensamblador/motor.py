@@ -0,0 +1,299 @@
+"""Motor de enriquecimiento concurrente sobre el modelo de Gemini.
+
+Mantiene varias peticiones en vuelo a la vez en lugar de esperar cada
+``generate_content`` en serie. Los resultados se devuelven indexados por la
+fila original, así que el orden de llegada no importa.
+"""
+
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from dataclasses import dataclass
+
+from .cache import clave_respuesta
+from .limitador import PoliticaReintentos, estimar_tokens
+from .lotes import CAMPOS_LOTE, OPCIONES_GENERACION, construir_prompt_lote, instrucciones_lote, parsear_lote
+from .modelo import con_instrucciones
+from .respuestas import (
+    COLUMNAS_ANALISIS,
+    COLUMNAS_RECOMENDACIONES,
+    parsear_analisis,
+    parsear_recomendaciones,
+)
+from .telemetria import NULA
+
+ANALISIS = "analisis"
+RECOMENDACIONES = "recomendaciones"
+# Un ítem resuelto en modo lote: llena las columnas de ambos tipos.
+LOTE = "lote"
+
+# Columnas que llena cada tipo de prompt y la función que separa su respuesta.
+TIPOS = {
+    ANALISIS: (COLUMNAS_ANALISIS, parsear_analisis),
+    RECOMENDACIONES: (COLUMNAS_RECOMENDACIONES, parsear_recomendaciones),
+}
+
+CONCURRENCIA_POR_DEFECTO = 8
+
+# Marcas que deja el enriquecimiento cuando una fila no se pudo completar.
+_PATRON_ERROR = re.compile(r"^ERROR(?: API|:|$)")
+MARCA_PRESUPUESTO = "ERROR: el prompt supera el presupuesto de tokens"
+
+
+class PresupuestoExcedido(ValueError):
+    """El prompt estimado supera ``max_tokens_prompt``; no se envía a la API."""
+
+
+@dataclass
+class Trabajo:
+    """Una petición al modelo: la fila a la que pertenece, su tipo y el prompt."""
+    indice: object
+    tipo: str
+    prompt: str
+    # Clave estable de la fila para la bitácora; si falta se usa ``indice``.
+    identidad: object = None
+    # Argumentos extra para ``generate_content`` (p. ej. salida JSON en modo lote).
+    opciones: dict = None
+    # Instrucción de sistema, común a todos los trabajos del mismo tipo en una ejecución.
+    sistema: str = None
+
+
+def _respuesta_valida(trabajo, texto):
+    """True si ``texto`` se separa sin marcas de error; solo esas respuestas pasan por la caché."""
+    if trabajo.tipo == LOTE:
+        return not parsear_lote(texto, trabajo.identidad)[1]
+    return not any(es_error(valor) for valor in TIPOS[trabajo.tipo][1](texto))
+
+
+def _generar(model, trabajo, limitador, reintentos, cache, firma_modelo, max_tokens_prompt=None, telemetria=NULA):
+    opciones = trabajo.opciones or {}
+    # La instrucción de sistema también se cobra como entrada en cada llamada.
+    tokens = estimar_tokens(trabajo.prompt) + (estimar_tokens(trabajo.sistema) if trabajo.sistema else 0)
+    telemetria.sumar("prompt.tokens_estimados", tokens)
+    if max_tokens_prompt and tokens > max_tokens_prompt:
+        telemetria.sumar("prompt.excedidos")
+        raise PresupuestoExcedido(f"El prompt ocupa unos {tokens} tokens y el presupuesto es de {max_tokens_prompt}.")
+    if cache is not None:
+        firma = firma_modelo or {}
+        if opciones:
+            firma = {**firma, "opciones": opciones}
+        if trabajo.sistema:
+            firma = {**firma, "sistema": trabajo.sistema}
+        clave = clave_respuesta(trabajo.prompt, firma)
+        texto = cache.obtener(clave, lambda guardado: _respuesta_valida(trabajo, guardado))
+        if texto is not None:
+            telemetria.sumar("cache.aciertos")
+            return texto
+
+    def llamar():
+        inicio = time.perf_counter()
+        try:
+            respuesta = model.generate_content(trabajo.prompt, **opciones)
+            # ``response.text`` se lee dentro del reintento: un bloqueo de seguridad
+            # se manifiesta ahí y debe clasificarse como error definitivo.
+            texto = respuesta.text.strip()
+        except Exception:
+            telemetria.sumar(f"api.errores.{trabajo.tipo}")
+            raise
+        finally:
+            telemetria.observar(f"api.{trabajo.tipo}", time.perf_counter() - inicio)
+        uso = getattr(respuesta, "usage_metadata", None)
+        if uso is not None:
+            # Totales y por tipo de prompt, para saber qué plantilla genera el costo.
+            for sentido, campo in (("entrada", "prompt_token_count"), ("salida", "candidates_token_count")):
+                cantidad = getattr(uso, campo, 0) or 0
+                telemetria.sumar(f"tokens.{sentido}", cantidad)
+                telemetria.sumar(f"tokens.{sentido}.{trabajo.tipo}", cantidad)
+        return texto
+
+    # Incluye las esperas por cuota y los reintentos, no solo la llamada.
+    with telemetria.medir(f"peticion.{trabajo.tipo}"):
+        texto = reintentos.ejecutar(llamar, limitador, tokens, telemetria)
+    if cache is not None and _respuesta_valida(trabajo, texto):
+        # Una respuesta sin los encabezados o el esquema esperados no se guarda:
+        # al reintentar la fila debe volver a pedirse al modelo.
+        cache.guardar(clave, texto)
+    return texto
+
+
+def _modelos(model, trabajos):
+    """``{instrucción de sistema: modelo}``, uno por cada instrucción distinta de ``trabajos``."""
+    return {sistema: con_instrucciones(model, sistema) for sistema in {t.sistema for t in trabajos if t.sistema}}
+
+
+def _marca(error):
+    return MARCA_PRESUPUESTO if isinstance(error, PresupuestoExcedido) else "ERROR API"
+
+
+def _cancelar(futuros):
+    """Descarta las peticiones aún en cola; las que ya están en curso terminan solas."""
+    for futuro in futuros:
+        futuro.cancel()
+
+
+def enriquecer(model, trabajos, max_concurrencia=CONCURRENCIA_POR_DEFECTO, al_completar=None,
+               limitador=None, reintentos=None, cache=None, firma_modelo=None, bitacora=None, max_tokens_prompt=None,
+               telemetria=None):
+    """Ejecuta ``trabajos`` con hasta ``max_concurrencia`` peticiones simultáneas.
+
+    ``limitador`` (un :class:`~ensamblador.limitador.Limitador`) marca el ritmo
+    según la cuota y ``reintentos`` decide qué errores se vuelven a intentar.
+    Con ``cache`` (una :class:`~ensamblador.cache.CacheRespuestas`) los prompts
+    ya respondidos para la misma ``firma_modelo`` no llegan a la API.
+    Cada trabajo se envía con su instrucción de sistema (``Trabajo.sistema``)
+    y no se envía si su estimación de tokens supera ``max_tokens_prompt``.
+    Con ``bitacora`` cada resultado se persiste en cuanto llega y con
+    ``telemetria`` (una :class:`~ensamblador.telemetria.Telemetria`) se
+    anotan latencias, tokens y fallos al separar las respuestas.
+
+    ``al_completar(trabajo, error, completados, total)`` se invoca en el hilo
+    que llama, en orden de llegada, para poder actualizar la interfaz. Si
+    lanza una excepción (p. ej. al cancelar), las peticiones en cola se
+    descartan y la excepción se propaga.
+    Devuelve ``{columna: {indice: valor}}``; las filas que fallan quedan
+    marcadas con "ERROR API" (o :data:`MARCA_PRESUPUESTO`) en todas las
+    columnas de su tipo.
+    """
+    trabajos = list(trabajos)
+    modelos = _modelos(model, trabajos)
+    reintentos = reintentos or PoliticaReintentos()
+    telemetria = telemetria or NULA
+    resultados = {}
+    for columnas, _ in TIPOS.values():
+        for columna in columnas:
+            resultados[columna] = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, int(max_concurrencia))) as executor:
+        futuros = {executor.submit(_generar, modelos.get(trabajo.sistema, model), trabajo, limitador, reintentos, cache,
+                                   firma_modelo, max_tokens_prompt, telemetria): trabajo
+                   for trabajo in trabajos}
+        try:
+            for completados, futuro in enumerate(as_completed(futuros), start=1):
+                trabajo = futuros[futuro]
+                columnas, parsear = TIPOS[trabajo.tipo]
+                error = futuro.exception()
+                if error is None:
+                    with telemetria.medir(f"parseo.{trabajo.tipo}"):
+                        valores = parsear(futuro.result())
+                    if any(es_error(valor) for valor in valores):
+                        # No se encontraron los encabezados esperados en la respuesta.
+                        telemetria.sumar(f"parseo.fallos.{trabajo.tipo}")
+                else:
+                    valores = (_marca(error),) * len(columnas)
+                for columna, valor in zip(columnas, valores):
+                    resultados[columna][trabajo.indice] = valor
+                if bitacora is not None:
+                    identidad = trabajo.indice if trabajo.identidad is None else trabajo.identidad
+                    bitacora.registrar(identidad, trabajo.tipo, dict(zip(columnas, valores)))
+                if al_completar:
+                    al_completar(trabajo, error, completados, len(trabajos))
+        except BaseException:
+            _cancelar(futuros)
+            raise
+
+    return {columna: valores for columna, valores in resultados.items() if valores}
+
+
+def enriquecer_en_lotes(model, items, tam_lote, max_concurrencia=CONCURRENCIA_POR_DEFECTO, al_completar=None,
+                        limitador=None, reintentos=None, cache=None, firma_modelo=None, bitacora=None,
+                        prompt_adicional="", max_tokens_prompt=None, telemetria=None):
+    """Como :func:`enriquecer`, pero con ``tam_lote`` ítems por petición.
+
+    ``items`` es una lista de ``(indice, identidad, insumos)``; la identidad
+    (única) es el id con el que el modelo responde cada ítem. Los ítems que
+    no superan la validación del JSON, o cuyo lote excede
+    ``max_tokens_prompt``, se reenvían uno a uno; si fallan también así,
+    quedan marcados como "ERROR" (o "ERROR API" si falló la llamada). ``al_completar`` recibe un :class:`Trabajo` de tipo ``LOTE``
+    por ítem terminado.
+    """
+    items = list(items)
+    tam_lote = max(1, int(tam_lote))
+    reintentos = reintentos or PoliticaReintentos()
+    telemetria = telemetria or NULA
+    resultados = {columna: {} for columna in CAMPOS_LOTE.values()}
+    completados = 0
+    sistema = instrucciones_lote(prompt_adicional)
+    modelo_lote = con_instrucciones(model, sistema)
+
+    with ThreadPoolExecutor(max_workers=max(1, int(max_concurrencia))) as executor:
+        futuros = {}
+
+        def enviar(grupo):
+            ids = tuple(str(identidad) for _, identidad, _ in grupo)
+            prompt = construir_prompt_lote([(id_item, insumos) for id_item, (_, _, insumos) in zip(ids, grupo)])
+            trabajo = Trabajo(tuple(indice for indice, _, _ in grupo), LOTE, prompt, ids, OPCIONES_GENERACION, sistema)
+            futuros[executor.submit(_generar, modelo_lote, trabajo, limitador, reintentos, cache, firma_modelo,
+                                    max_tokens_prompt, telemetria)] = (trabajo, grupo)
+
+        for inicio in range(0, len(items), tam_lote):
+            enviar(items[inicio:inicio + tam_lote])
+
+        try:
+            while futuros:
+                listos, _ = wait(futuros, return_when=FIRST_COMPLETED)
+                for futuro in listos:
+                    trabajo, grupo = futuros.pop(futuro)
+                    error = futuro.exception()
+                    if error is None:
+                        with telemetria.medir("parseo.lote"):
+                            validos, fallidos = parsear_lote(futuro.result(), trabajo.identidad)
+                        if fallidos:
+                            telemetria.sumar("parseo.fallos.lote", len(fallidos))
+                        marca = "ERROR"
+                    else:
+                        validos, fallidos = {}, set(trabajo.identidad)
+                        marca = _marca(error)
+
+                    for item, id_item in zip(grupo, trabajo.identidad):
+                        indice, identidad, _ = item
+                        if id_item in fallidos and len(grupo) > 1:
+                            enviar([item])
+                            continue
+                        valores = validos.get(id_item) or {columna: marca for columna in CAMPOS_LOTE.values()}
+                        for columna, valor in valores.items():
+                            resultados[columna][indice] = valor
+                        if bitacora is not None:
+                            for tipo, (columnas, _) in TIPOS.items():
+                                bitacora.registrar(identidad, tipo, {c: valores[c] for c in columnas})
+                        completados += 1
+                        if al_completar:
+                            fallo = error or (ValueError("La respuesta no cumple el esquema JSON esperado") if id_item in fallidos else None)
+                            al_completar(Trabajo(indice, LOTE, trabajo.prompt, identidad), fallo, completados, len(items))
+        except BaseException:
+            _cancelar(futuros)
+            raise
+
+    return {columna: valores for columna, valores in resultados.items() if valores}
+
+
+def es_error(valor):
+    """True si ``valor`` es una de las marcas de error que deja el enriquecimiento."""
+    return isinstance(valor, str) and _PATRON_ERROR.match(valor) is not None
+
+
+def filas_con_error(df):
+    """Índices de las filas con alguna columna de cada tipo marcada como ERROR."""
+    pendientes = {}
+    for tipo, (columnas, _) in TIPOS.items():
+        presentes = [c for c in columnas if c in df.columns]
+        if len(presentes) < len(columnas):
+            # Si falta alguna columna, el tipo entero está por generar.
+            pendientes[tipo] = list(df.index)
+            continue
+        marcas = df[presentes].apply(lambda col: col.astype(str).str.match(_PATRON_ERROR))
+        pendientes[tipo] = list(df.index[marcas.any(axis=1)])
+    return pendientes
+
+
+def aplicar_resultados(df, resultados):
+    """Escribe en ``df`` los valores devueltos por :func:`enriquecer`, fila por fila."""
+    # pandas se importa aquí para que la línea de comandos arranque sin cargarlo.
+    import pandas as pd
+
+    for columna, valores in resultados.items():
+        if columna not in df.columns:
+            df[columna] = pd.Series(valores, dtype=object)
+        else:
+            df[columna] = df[columna].astype(object)
+            df.loc[list(valores), columna] = list(valores.values())
+    return df
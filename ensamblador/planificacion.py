@@ -0,0 +1,116 @@
+"""Planificación previa al enriquecimiento: un solo envío por prompt distinto.
+
+Los bancos de ítems repiten el mismo ítem en varias formas, grados o
+cuadernillos con solo el ``ItemId`` cambiado. Antes de llamar al modelo se
+calcula una huella de los campos que lee cada prompt (ya limpios de HTML);
+las filas con la misma huella comparten un representante, que es el único
+que se envía, y su resultado se copia a las demás.
+"""
+
+import hashlib
+from dataclasses import dataclass, field
+
+from .lotes import CAMPOS_INSUMOS
+from .motor import ANALISIS, RECOMENDACIONES, TIPOS
+from .prompts import CAMPOS_ANALISIS, CAMPOS_RECOMENDACIONES
+
+CAMPOS_POR_TIPO = {ANALISIS: CAMPOS_ANALISIS, RECOMENDACIONES: CAMPOS_RECOMENDACIONES}
+
+_SEPARADOR = "\x1f"
+
+
+def huellas(df, campos):
+    """``{índice: sha256}`` de los valores de ``campos`` en cada fila de ``df``.
+
+    Las columnas que no existen se ignoran: faltan en todas las filas y el
+    prompt usa entonces el mismo valor por defecto para todas.
+    """
+    presentes = [c for c in campos if c in df.columns]
+    columnas = [df[c].fillna('').astype(str).tolist() for c in presentes]
+    resultado = {}
+    for indice, valores in zip(df.index, zip(*columnas) if columnas else ((),) * len(df)):
+        resultado[indice] = hashlib.sha256(_SEPARADOR.join(valores).encode("utf-8")).hexdigest()
+    return resultado
+
+
+@dataclass
+class Plan:
+    """Filas que se envían por tipo y las que reciben una copia de su resultado."""
+    # {tipo: [índices que se envían al modelo]}
+    envios: dict
+    # {tipo: {índice copia: índice representante}}
+    copias: dict = field(default_factory=dict)
+    tam_lote: int = 1
+
+    def _llamadas(self, filas_por_tipo):
+        if self.tam_lote > 1:
+            # En modo lote una petición cubre ambos tipos de hasta tam_lote ítems.
+            return -(-filas_por_tipo.get(ANALISIS, 0) // self.tam_lote)
+        return sum(filas_por_tipo.values())
+
+    @property
+    def filas(self):
+        """Filas pendientes por tipo, contando las copias."""
+        return {tipo: len(indices) + len(self.copias.get(tipo, {})) for tipo, indices in self.envios.items()}
+
+    @property
+    def llamadas(self):
+        return self._llamadas({tipo: len(indices) for tipo, indices in self.envios.items()})
+
+    @property
+    def llamadas_sin_deduplicar(self):
+        return self._llamadas(self.filas)
+
+    @property
+    def llamadas_ahorradas(self):
+        return self.llamadas_sin_deduplicar - self.llamadas
+
+    @property
+    def proporcion_duplicados(self):
+        """Fracción de las filas pendientes que reutilizan el resultado de otra."""
+        total = sum(self.filas.values())
+        return sum(len(c) for c in self.copias.values()) / total if total else 0.0
+
+
+def planificar(df, pendientes, tam_lote=1, deduplicar=True):
+    """Agrupa las filas de ``pendientes`` ({tipo: índices}) por huella de su prompt.
+
+    En modo lote (``tam_lote`` > 1) se comparan los insumos del ítem, que
+    cubren ambos tipos a la vez. Con ``deduplicar=False`` se envían todas.
+    """
+    tam_lote = max(1, int(tam_lote))
+    envios, copias = {}, {}
+    for tipo in (ANALISIS, RECOMENDACIONES):
+        indices = list(pendientes.get(tipo, []))
+        envios[tipo], copias[tipo] = [], {}
+        if not deduplicar:
+            envios[tipo] = indices
+            continue
+        campos = CAMPOS_INSUMOS if tam_lote > 1 else CAMPOS_POR_TIPO[tipo]
+        representantes = {}
+        for indice, huella in huellas(df.loc[indices], campos).items():
+            if huella in representantes:
+                copias[tipo][indice] = representantes[huella]
+            else:
+                representantes[huella] = indice
+                envios[tipo].append(indice)
+    return Plan(envios, copias, tam_lote)
+
+
+def propagar(resultados, plan, identidades=None, bitacora=None):
+    """Copia en ``resultados`` ({columna: {índice: valor}}) el valor del representante de cada copia.
+
+    Con ``bitacora`` las copias también quedan registradas con su propia
+    identidad (``identidades``), para que una reanudación no las repita.
+    """
+    for tipo, copias in plan.copias.items():
+        columnas = [c for c in TIPOS[tipo][0] if c in resultados]
+        for copia, representante in copias.items():
+            valores = {c: resultados[c][representante] for c in columnas if representante in resultados[c]}
+            if not valores:
+                continue
+            for columna, valor in valores.items():
+                resultados[columna][copia] = valor
+            if bitacora is not None and len(valores) == len(TIPOS[tipo][0]):
+                bitacora.registrar(copia if identidades is None else identidades[copia], tipo, valores)
+    return resultados
@@ -0,0 +1,28 @@
+"""Separación de las respuestas del modelo en las columnas del Excel enriquecido."""
+
+COLUMNAS_ANALISIS = ("Que_Evalua", "Justificacion_Correcta", "Analisis_Distractores")
+COLUMNAS_RECOMENDACIONES = ("Recomendacion_Fortalecer", "Recomendacion_Avanzar")
+# Las que escribe el enriquecimiento; al releer un Excel enriquecido no se limpian.
+COLUMNAS_GENERADAS = COLUMNAS_ANALISIS + COLUMNAS_RECOMENDACIONES
+
+
+def parsear_analisis(texto_completo):
+    """Divide la respuesta de análisis en (qué evalúa, ruta correcta, distractores)."""
+    header_que_evalua = "Qué Evalúa:"
+    header_correcta = "Ruta Cognitiva Correcta:"
+    header_distractores = "Análisis de Opciones No Válidas:"
+    idx_correcta = texto_completo.find(header_correcta)
+    idx_distractores = texto_completo.find(header_distractores)
+    que_evalua = texto_completo[len(header_que_evalua):idx_correcta].strip() if idx_correcta != -1 else texto_completo
+    just_correcta = texto_completo[idx_correcta:idx_distractores].strip() if idx_correcta != -1 and idx_distractores != -1 else (texto_completo[idx_correcta:].strip() if idx_correcta != -1 else "ERROR")
+    an_distractores = texto_completo[idx_distractores:].strip() if idx_distractores != -1 else "ERROR"
+    return que_evalua, just_correcta, an_distractores
+
+
+def parsear_recomendaciones(texto_completo):
+    """Divide la respuesta de recomendaciones en (fortalecer, avanzar)."""
+    titulo_avanzar = "RECOMENDACIÓN PARA AVANZAR"
+    idx_avanzar = texto_completo.upper().find(titulo_avanzar)
+    if idx_avanzar != -1:
+        return texto_completo[:idx_avanzar].strip(), texto_completo[idx_avanzar:].strip()
+    return texto_completo, "ERROR: No se encontró 'AVANZAR'"
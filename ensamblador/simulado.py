@@ -0,0 +1,151 @@
+"""Modelo de Gemini simulado para pruebas de rendimiento sin red ni cuota.
+
+Implementa la parte de ``genai.GenerativeModel`` que usa la aplicación
+(``generate_content`` con ``.text`` y ``.usage_metadata``, e instrucciones
+de sistema con :meth:`ModeloSimulado.con_instrucciones`) y responde con
+textos deterministas en los mismos formatos que el modelo real: análisis,
+recomendaciones o el arreglo JSON del modo lote. La latencia sigue una
+distribución configurable y se pueden inyectar errores 5xx y 429.
+"""
+
+import copy
+import hashlib
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from .lotes import CAMPOS_LOTE, ENCABEZADO_ITEMS
+
+
+class ErrorSimulado(Exception):
+    """Error de API con el estado HTTP en ``code``, como en ``google.api_core``."""
+
+    def __init__(self, code, mensaje):
+        super().__init__(f"{code} {mensaje}")
+        self.code = code
+
+
+def distribucion_latencia(especificacion):
+    """Convierte ``"fija:s"``, ``"uniforme:a,b"`` o ``"lognormal:mediana,sigma"`` en un muestreador.
+
+    El muestreador recibe un ``random.Random`` y devuelve segundos.
+    """
+    if callable(especificacion):
+        return especificacion
+    if isinstance(especificacion, (int, float)):
+        return lambda rng: float(especificacion)
+    nombre, _, parametros = especificacion.partition(":")
+    valores = [float(v) for v in parametros.split(",") if v]
+    if nombre == "fija":
+        return lambda rng: valores[0]
+    if nombre == "uniforme":
+        return lambda rng: rng.uniform(valores[0], valores[1])
+    if nombre == "lognormal":
+        import math
+        mu = math.log(valores[0])
+        return lambda rng: rng.lognormvariate(mu, valores[1])
+    raise ValueError(f"Distribución de latencia desconocida: {especificacion!r}")
+
+
+def _relleno(semilla, palabras):
+    rng = random.Random(semilla)
+    vocabulario = ("fracciones", "tabla", "gráfico", "suma", "patrón", "medida", "razonamiento",
+                   "estrategia", "diagrama", "comparar", "representar", "verificar", "datos")
+    return " ".join(rng.choice(vocabulario) for _ in range(palabras))
+
+
+def respuesta_analisis(semilla, palabras=60):
+    return (
+        f"Qué Evalúa:\nEl ítem evalúa la capacidad del estudiante para {_relleno(semilla, 12)}.\n\n"
+        f"Ruta Cognitiva Correcta:\n{_relleno(semilla + 1, palabras)}.\n\n"
+        "Análisis de Opciones No Válidas:\n"
+        + "\n".join(f"- El estudiante podría escoger la Opcion{letra} porque {_relleno(semilla + n, palabras // 3)}. "
+                    f"Sin embargo, esto es incorrecto porque {_relleno(semilla - n, palabras // 4)}."
+                    for n, letra in enumerate("ABC", start=2))
+    )
+
+
+def respuesta_recomendaciones(semilla, palabras=60):
+    bloques = []
+    for n, nivel in enumerate(("FORTALECER", "AVANZAR")):
+        bloques.append(
+            f"RECOMENDACIÓN PARA {nivel} EL APRENDIZAJE EVALUADO EN EL ÍTEM\n"
+            f"Para {nivel.lower()} en la habilidad de {_relleno(semilla + n, 3)}, se sugiere {_relleno(semilla + n, palabras)}.\n"
+            f"Una actividad que se puede hacer es: {_relleno(semilla - n, palabras)}.\n"
+            "Las preguntas orientadoras para esta actividad, entre otras, pueden ser:\n"
+            + "\n".join(f"- ¿{_relleno(semilla + 10 * n + k, 8)}?" for k in range(5))
+        )
+    return "\n\n".join(bloques)
+
+
+class ModeloSimulado:
+    """Sustituto de ``genai.GenerativeModel`` seguro para usar desde varios hilos."""
+
+    def __init__(self, latencia="lognormal:0.02,0.5", tasa_error=0.0, tasa_429=0.0, palabras=60, semilla=0):
+        self.model_name = "models/simulado"
+        self._latencia = distribucion_latencia(latencia)
+        self.tasa_error = tasa_error
+        self.tasa_429 = tasa_429
+        self.palabras = palabras
+        self._rng = random.Random(semilla)
+        self._lock = threading.Lock()
+        self.instrucciones = ""
+        # Compartidos con las copias de ``con_instrucciones``.
+        self._uso = {"llamadas": 0, "tokens_entrada": 0}
+
+    @property
+    def llamadas(self):
+        return self._uso["llamadas"]
+
+    @property
+    def tokens_entrada(self):
+        """Tokens de entrada facturados, instrucciones de sistema incluidas."""
+        return self._uso["tokens_entrada"]
+
+    def con_instrucciones(self, instrucciones):
+        """Copia que envía ``instrucciones`` como instrucción de sistema; comparte sorteos y contadores."""
+        copia = copy.copy(self)
+        copia.instrucciones = instrucciones or ""
+        return copia
+
+    def _sortear(self):
+        with self._lock:
+            self._uso["llamadas"] += 1
+            return self._latencia(self._rng), self._rng.random()
+
+    def generate_content(self, prompt, **kwargs):
+        espera, sorteo = self._sortear()
+        time.sleep(max(0.0, espera))
+        if sorteo < self.tasa_429:
+            raise ErrorSimulado(429, "Resource has been exhausted (simulado)")
+        if sorteo < self.tasa_429 + self.tasa_error:
+            raise ErrorSimulado(503, "Service unavailable (simulado)")
+
+        semilla = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+        if ENCABEZADO_ITEMS in prompt:
+            items = json.loads(prompt.split(ENCABEZADO_ITEMS, 1)[1])
+            texto = json.dumps([self._objeto_lote(item["id"]) for item in items], ensure_ascii=False)
+        elif "FORMATO DE SALIDA DE LAS RECOMENDACIONES" in self.instrucciones + prompt:
+            texto = respuesta_recomendaciones(semilla, self.palabras)
+        else:
+            texto = respuesta_analisis(semilla, self.palabras)
+        # Como en la API, la instrucción de sistema cuenta como entrada en cada llamada.
+        uso = SimpleNamespace(prompt_token_count=len(self.instrucciones + prompt) // 4, candidates_token_count=len(texto) // 4)
+        with self._lock:
+            self._uso["tokens_entrada"] += uso.prompt_token_count
+        uso.total_token_count = uso.prompt_token_count + uso.candidates_token_count
+        return SimpleNamespace(text=texto, usage_metadata=uso)
+
+    def _objeto_lote(self, id_item):
+        semilla = int(hashlib.sha256(str(id_item).encode("utf-8")).hexdigest()[:8], 16)
+        analisis = respuesta_analisis(semilla, self.palabras)
+        fortalecer, _, avanzar = respuesta_recomendaciones(semilla, self.palabras).partition("\n\n")
+        return {"id": id_item, **dict(zip(CAMPOS_LOTE, (
+            analisis.split("\n")[1],
+            analisis.split("Ruta Cognitiva Correcta:\n")[1].split("\n\n")[0],
+            analisis.split("Análisis de Opciones No Válidas:\n")[1],
+            fortalecer,
+            avanzar,
+        )))}
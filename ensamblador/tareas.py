@@ -0,0 +1,377 @@
+"""Tareas en segundo plano: enriquecimiento y ensamblaje fuera del hilo de la página.
+
+Cada tarea corre en un pool de hilos propio del proceso y guarda su estado y
+su avance en ``<directorio>/<id>/estado.json``, así la página puede
+consultarlo en cada rerun o tras recargar el navegador. Cada tarea lleva el
+token de su propietario y solo él la ve, la carga, la cancela o la descarta.
+Sus resultados (Excel enriquecido, volúmenes .zip) quedan en esa misma
+carpeta. Cancelar una tarea la detiene en el siguiente avance; lo ya
+generado sigue en la bitácora y se recupera al reanudar.
+"""
+
+import functools
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from io import BytesIO
+
+from .modelo import PRECIO_POR_MILLON
+from .telemetria import Telemetria, perfil
+
+DIRECTORIO_POR_DEFECTO = os.environ.get(
+    "ENSAMBLADOR_TAREAS", os.path.join(os.path.expanduser("~"), ".cache", "ensamblador", "tareas")
+)
+SIMULTANEAS_POR_DEFECTO = int(os.environ.get("ENSAMBLADOR_TAREAS_SIMULTANEAS", "2"))
+# Las tareas terminadas se borran del disco pasado este tiempo.
+DIAS_RETENCION = 7
+
+ENRIQUECIMIENTO = "enriquecimiento"
+ENSAMBLAJE = "ensamblaje"
+
+EN_COLA = "en cola"
+EN_CURSO = "en curso"
+COMPLETADA = "completada"
+CANCELADA = "cancelada"
+FALLIDA = "fallida"
+# Estaba en curso cuando se detuvo el servidor.
+INTERRUMPIDA = "interrumpida"
+TERMINADAS = (COMPLETADA, CANCELADA, FALLIDA, INTERRUMPIDA)
+
+# Como mucho un guardado del avance por intervalo (en segundos).
+_INTERVALO_GUARDADO = 0.5
+_MAX_ERRORES = 50
+_PERSISTIDOS = ("id", "tipo", "descripcion", "estado", "hechos", "total", "mensaje",
+                "avisos", "errores", "resultado", "creada", "actualizada", "propietario")
+
+
+class TareaCancelada(Exception):
+    """Se lanza dentro de una tarea cuando se pidió cancelarla."""
+
+
+@dataclass
+class Tarea:
+    """Estado y avance de un trabajo en segundo plano."""
+    id: str
+    tipo: str
+    descripcion: str
+    directorio: str
+    estado: str = EN_COLA
+    hechos: int = 0
+    total: int = 0
+    mensaje: str = ""
+    # Información para mostrar al terminar (filas recuperadas, caché...).
+    avisos: list = field(default_factory=list)
+    # Últimos errores por fila; la tarea sigue con las demás.
+    errores: list = field(default_factory=list)
+    resultado: dict = field(default_factory=dict)
+    creada: float = field(default_factory=time.time)
+    actualizada: float = field(default_factory=time.time)
+    # Token de quien la lanzó; las consultas con ``propietario`` solo ven las suyas.
+    propietario: str = None
+    _cancelacion: threading.Event = field(default_factory=threading.Event, repr=False, compare=False)
+    _guardado: float = field(default=0.0, repr=False, compare=False)
+
+    @property
+    def terminada(self):
+        return self.estado in TERMINADAS
+
+    @property
+    def progreso(self):
+        return min(1.0, self.hechos / self.total) if self.total else 0.0
+
+    def ruta(self, nombre):
+        """Ruta de un archivo dentro de la carpeta de la tarea."""
+        return os.path.join(self.directorio, nombre)
+
+    def guardar(self, forzar=False):
+        ahora = time.time()
+        if not forzar and ahora - self._guardado < _INTERVALO_GUARDADO:
+            return
+        self._guardado = self.actualizada = ahora
+        os.makedirs(self.directorio, exist_ok=True)
+        temporal = self.ruta("estado.json.tmp")
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump({nombre: getattr(self, nombre) for nombre in _PERSISTIDOS}, archivo, ensure_ascii=False)
+        # El reemplazo es atómico: quien lee nunca ve un estado a medio escribir.
+        os.replace(temporal, self.ruta("estado.json"))
+
+    @classmethod
+    def cargar(cls, directorio):
+        with open(os.path.join(directorio, "estado.json"), encoding="utf-8") as archivo:
+            estado = json.load(archivo)
+        return cls(directorio=directorio, **{nombre: estado[nombre] for nombre in _PERSISTIDOS if nombre in estado})
+
+    def comprobar(self):
+        """Lanza :class:`TareaCancelada` si se pidió cancelar la tarea."""
+        if self._cancelacion.is_set():
+            raise TareaCancelada()
+
+    def avanzar(self, hechos, total, mensaje=None):
+        """Actualiza el avance; sirve directamente como ``al_avanzar(hechos, total)``."""
+        self.comprobar()
+        self.hechos, self.total = hechos, total
+        if mensaje is not None:
+            self.mensaje = mensaje
+        self.guardar(forzar=hechos == total)
+
+    def avisar(self, aviso):
+        self.avisos.append(aviso)
+        self.guardar(forzar=True)
+
+    def registrar_error(self, error):
+        self.errores = (self.errores + [error])[-_MAX_ERRORES:]
+
+    def cancelar(self):
+        self._cancelacion.set()
+
+
+class GestorTareas:
+    """Cola de tareas compartida por todas las sesiones de la aplicación.
+
+    ``max_simultaneas`` tareas corren a la vez; el resto espera en cola. Al
+    crearse recupera las tareas guardadas en ``directorio``: las que estaban
+    en curso quedan como interrumpidas y las antiguas se borran.
+    """
+
+    def __init__(self, directorio=DIRECTORIO_POR_DEFECTO, max_simultaneas=SIMULTANEAS_POR_DEFECTO):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+        self._tareas = {}
+        self._futuros = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(max_simultaneas)), thread_name_prefix="tarea")
+        self._recuperar()
+
+    def _recuperar(self):
+        limite = time.time() - DIAS_RETENCION * 86400
+        for nombre in os.listdir(self.directorio):
+            carpeta = os.path.join(self.directorio, nombre)
+            try:
+                tarea = Tarea.cargar(carpeta)
+            except (OSError, ValueError, TypeError):
+                continue
+            if tarea.actualizada < limite:
+                shutil.rmtree(carpeta, ignore_errors=True)
+                continue
+            if not tarea.terminada:
+                tarea.estado = INTERRUMPIDA
+                tarea.mensaje = "El servidor se detuvo antes de terminar; vuelve a lanzarla para reanudar."
+                tarea.guardar(forzar=True)
+            self._tareas[tarea.id] = tarea
+
+    def enviar(self, tipo, descripcion, funcion, *args, propietario=None, **kwargs):
+        """Encola ``funcion(tarea, *args, **kwargs)``; lo que devuelva queda como ``tarea.resultado``."""
+        id_tarea = uuid.uuid4().hex[:12]
+        tarea = Tarea(id_tarea, tipo, descripcion, os.path.join(self.directorio, id_tarea), propietario=propietario)
+        tarea.guardar(forzar=True)
+        with self._lock:
+            self._tareas[id_tarea] = tarea
+            self._futuros[id_tarea] = self._executor.submit(self._ejecutar, tarea, funcion, args, kwargs)
+        return tarea
+
+    def _ejecutar(self, tarea, funcion, args, kwargs):
+        try:
+            tarea.comprobar()
+            tarea.estado = EN_CURSO
+            tarea.guardar(forzar=True)
+            tarea.resultado = funcion(tarea, *args, **kwargs) or {}
+            tarea.estado = COMPLETADA
+        except TareaCancelada:
+            tarea.estado = CANCELADA
+            tarea.mensaje = "Cancelada."
+        except Exception as e:
+            tarea.estado = FALLIDA
+            tarea.mensaje = f"{type(e).__name__}: {e}"
+        finally:
+            tarea.guardar(forzar=True)
+            with self._lock:
+                self._futuros.pop(tarea.id, None)
+
+    def obtener(self, id_tarea, propietario=None):
+        """La tarea ``id_tarea`` si existe y, con ``propietario``, si es suya; si no, None."""
+        tarea = self._tareas.get(id_tarea)
+        if tarea is None or (propietario is not None and tarea.propietario != propietario):
+            return None
+        return tarea
+
+    def listar(self, propietario=None):
+        """Las tareas conocidas (solo las de ``propietario``, si se indica), de la más reciente a la más antigua."""
+        with self._lock:
+            tareas = [tarea for tarea in self._tareas.values() if propietario is None or tarea.propietario == propietario]
+        return sorted(tareas, key=lambda tarea: tarea.creada, reverse=True)
+
+    def cancelar(self, id_tarea, propietario=None):
+        tarea = self.obtener(id_tarea, propietario)
+        if tarea is None or tarea.terminada:
+            return
+        tarea.cancelar()
+        futuro = self._futuros.get(id_tarea)
+        if futuro is not None and futuro.cancel():
+            # No había empezado: no pasará por _ejecutar.
+            tarea.estado = CANCELADA
+            tarea.mensaje = "Cancelada antes de empezar."
+            tarea.guardar(forzar=True)
+
+    def descartar(self, id_tarea, propietario=None):
+        """Borra una tarea terminada y sus archivos."""
+        tarea = self.obtener(id_tarea, propietario)
+        if tarea is None or not tarea.terminada:
+            return
+        with self._lock:
+            del self._tareas[id_tarea]
+        shutil.rmtree(tarea.directorio, ignore_errors=True)
+
+    def cerrar(self):
+        for tarea in self.listar():
+            self.cancelar(tarea.id)
+        self._executor.shutdown(wait=True)
+
+
+def _instrumentada(funcion):
+    """Da a la tarea un registro de telemetría y, con ``perfilar=True``, un perfil de cProfile.
+
+    Ambos se guardan en la carpeta de la tarea aunque esta falle o se
+    cancele; el resumen queda además en ``resultado["telemetria"]``.
+    """
+    @functools.wraps(funcion)
+    def envoltura(tarea, *args, perfilar=False, **kwargs):
+        telemetria = Telemetria()
+        try:
+            with perfil(tarea.ruta("perfil.prof") if perfilar else None):
+                resultado = funcion(tarea, *args, telemetria=telemetria, **kwargs)
+        finally:
+            telemetria.terminar()
+            telemetria.guardar(tarea.ruta("telemetria.json"), tarea.ruta("telemetria.csv"), PRECIO_POR_MILLON)
+        resultado["telemetria"] = telemetria.resumen(PRECIO_POR_MILLON)
+        return resultado
+    return envoltura
+
+
+@_instrumentada
+def ejecutar_enriquecimiento(tarea, model, config, contenido_excel=None, columnas=None, reanudar=True,
+                             solo_errores=False, df=None, pendientes=None, ruta_bitacora=None, artefactos=None,
+                             telemetria=None):
+    """Tarea de enriquecimiento; guarda el Excel resultante en la carpeta de la tarea.
+
+    Con ``contenido_excel`` lee y limpia el libro (solo ``columnas``, si se
+    indican) y reanuda desde su bitácora; con ``artefactos`` (una
+    :class:`~ensamblador.artefactos.CacheArtefactos`) el libro ya leído no
+    se vuelve a procesar y el resultado queda en ella bajo
+    :func:`clave_resultado`. Con ``df`` procesa ``pendientes`` de ese
+    DataFrame, p. ej. para reintentar las filas con error.
+
+    ``solo_errores`` indica que se regeneran filas marcadas como ERROR: las
+    de ``pendientes`` o, si no se pasa ``df``, las del libro ya enriquecido.
+    Esas filas no se leen de la caché de respuestas.
+    """
+    from . import bitacora
+    from .exportacion import exportar_excel
+    from .flujo import enriquecer_dataframe, firma_ejecucion, planificar_ejecucion, todas_las_filas
+    from .limpieza import leer_excel_limpio
+    from .motor import filas_con_error
+    from .respuestas import COLUMNAS_GENERADAS
+
+    # Un Excel ya enriquecido conserva sus columnas generadas tal cual.
+    sin_limpiar = COLUMNAS_GENERADAS if solo_errores else ()
+    if solo_errores:
+        # La caché podría devolver la misma respuesta que dejó la fila en ERROR.
+        config = replace(config, omitir_cache=True)
+    if df is None:
+        tarea.avanzar(0, 0, "Leyendo y limpiando el Excel...")
+        if artefactos is None:
+            df = leer_excel_limpio(BytesIO(contenido_excel), columnas, telemetria, sin_limpiar)
+        else:
+            # La copia de la caché se comparte; el enriquecimiento escribe sobre la suya.
+            df = excel_limpio(artefactos, contenido_excel, columnas, telemetria, sin_limpiar).copy()
+        ruta_bitacora = bitacora.ruta_bitacora(contenido_excel, firma_ejecucion(config))
+        pendientes = todas_las_filas(df)
+        if reanudar:
+            pendientes, recuperados = bitacora.recuperar(df, ruta_bitacora, config.columna_id)
+            if recuperados:
+                tarea.avisar(f"Se recuperaron {recuperados} resultado(s) guardados; solo se generará lo que falta.")
+        if solo_errores:
+            pendientes = filas_con_error(df)
+            tarea.avisar(f"Se regenerarán {len(set().union(*pendientes.values()))} fila(s) con ERROR del Excel cargado.")
+
+    plan = planificar_ejecucion(df, pendientes, config)
+    if plan.llamadas_ahorradas:
+        tarea.avisar(f"🔁 {plan.proporcion_duplicados:.0%} de las filas pendientes repiten un ítem ya incluido: "
+                     f"se harán {plan.llamadas} llamadas a la API en lugar de {plan.llamadas_sin_deduplicar} "
+                     f"({plan.llamadas_ahorradas} ahorradas).")
+    tarea.avanzar(0, sum(len(indices) for indices in plan.envios.values()), "Generando análisis y recomendaciones...")
+
+    def al_completar(trabajo, error, completados, total):
+        if error is not None:
+            tarea.registrar_error(f"Fila {trabajo.indice + 1} ({trabajo.tipo}): {error}")
+        tarea.avanzar(completados, total)
+
+    df, estadisticas_cache = enriquecer_dataframe(model, df, config, pendientes, ruta_bitacora, al_completar, plan,
+                                                  telemetria)
+    if estadisticas_cache:
+        tarea.avisar(f"Caché: {estadisticas_cache['aciertos']} aciertos / {estadisticas_cache['fallos']} fallos.")
+    tarea.mensaje = "Guardando el Excel enriquecido..."
+    ruta_excel = tarea.ruta("excel_enriquecido_con_ia.xlsx")
+    with telemetria.medir("exportacion.excel"):
+        exportar_excel(df, ruta_excel)
+    if artefactos is not None:
+        # En la caché acotada, no en la tarea: las tareas se conservan días y no deben retener el DataFrame.
+        artefactos.guardar(clave_resultado(tarea), df)
+    tarea.mensaje = "Análisis de Ítems y Recomendaciones generados con éxito."
+    return {"excel": ruta_excel, "bitacora": ruta_bitacora, "estadisticas_cache": estadisticas_cache}
+
+
+def clave_resultado(tarea):
+    """Clave en :class:`~ensamblador.artefactos.CacheArtefactos` del DataFrame enriquecido por ``tarea``."""
+    return ("resultado", tarea.id)
+
+
+def excel_limpio(artefactos, contenido_excel, columnas=None, telemetria=None, sin_limpiar=()):
+    """Excel de ítems leído y limpio, memorizado por el contenido del archivo y las columnas."""
+    from .artefactos import huella
+    from .limpieza import leer_excel_limpio
+
+    clave = ("entrada", huella(contenido_excel, columnas, sin_limpiar))
+    return artefactos.obtener(clave, lambda: leer_excel_limpio(BytesIO(contenido_excel), columnas, telemetria, sin_limpiar))
+
+
+@_instrumentada
+def ejecutar_ensamblaje(tarea, df, plantilla_bytes, columna_nombre, procesos=None, max_bytes_volumen=None,
+                        anterior=None, telemetria=None):
+    """Tarea de ensamblaje; deja los volúmenes .zip y su manifiesto en la carpeta de la tarea.
+
+    Con ``anterior`` (la ruta del manifiesto de otro ensamblaje) solo se
+    renderizan las fichas nuevas o modificadas.
+    """
+    from .ensamblaje import SalidaZip, ensamblar_zip, escribir_manifiesto, leer_manifiesto
+
+    manifiesto_anterior = leer_manifiesto(anterior) if anterior else None
+    tarea.avanzar(0, len(df), "Ensamblando las fichas...")
+    if max_bytes_volumen:
+        salida = SalidaZip(max_bytes_volumen=max_bytes_volumen)
+        volumenes = ensamblar_zip(df, plantilla_bytes, columna_nombre, salida,
+                                  procesos=procesos, al_avanzar=tarea.avanzar, anterior=manifiesto_anterior,
+                                  telemetria=telemetria)
+        rutas = []
+        for numero, volumen in enumerate(volumenes, start=1):
+            rutas.append(tarea.ruta(f"fichas_tecnicas_generadas_parte{numero:02d}.zip"))
+            with open(rutas[-1], "wb") as destino:
+                shutil.copyfileobj(volumen, destino)
+            volumen.close()
+    else:
+        rutas = [tarea.ruta("fichas_tecnicas_generadas.zip")]
+        salida = SalidaZip(rutas[0])
+        ensamblar_zip(df, plantilla_bytes, columna_nombre, salida,
+                      procesos=procesos, al_avanzar=tarea.avanzar, anterior=manifiesto_anterior, telemetria=telemetria)
+    ruta_manifiesto = tarea.ruta("manifiesto.json")
+    escribir_manifiesto(ruta_manifiesto, salida, rutas)
+    if manifiesto_anterior is not None:
+        eliminadas = len(set(manifiesto_anterior["fichas"]) - set(salida.fichas))
+        tarea.avisar(f"{salida.copiadas} ficha(s) sin cambios reutilizadas, {len(df) - salida.copiadas} renderizada(s), "
+                     f"{eliminadas} eliminada(s).")
+    tarea.mensaje = "¡Ensamblaje completado!"
+    return {"volumenes": rutas, "manifiesto": ruta_manifiesto}
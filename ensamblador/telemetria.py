@@ -0,0 +1,172 @@
+"""Telemetría de una ejecución: tiempos de los puntos calientes y contadores.
+
+El motor, la ingesta y el ensamblaje reciben un registro opcional
+(``telemetria=None``) donde anotan cada duración y cada contador: latencia
+y tokens por llamada a la API, esperas por cuota y por reintento, fallos al
+separar las respuestas, tiempo de lectura y limpieza del Excel y de
+renderizado y guardado por ficha. Al final :meth:`Telemetria.resumen`
+calcula percentiles, rendimiento y costo, y el registro se exporta a JSON
+o CSV. Sin registro se usa :data:`NULA`, que no hace nada.
+"""
+
+import csv
+import io
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+_PERCENTILES = (50, 95, 99)
+
+
+def _percentil(ordenados, porcentaje):
+    # Rango más cercano: siempre es una de las muestras observadas.
+    indice = max(0, -(-len(ordenados) * porcentaje // 100) - 1)
+    return ordenados[min(indice, len(ordenados) - 1)]
+
+
+class Telemetria:
+    """Registro en memoria de duraciones (en segundos) y contadores, seguro entre hilos."""
+
+    def __init__(self):
+        self._muestras = {}
+        self._contadores = {}
+        self._lock = threading.Lock()
+        self._inicio = time.perf_counter()
+        self._fin = None
+
+    def observar(self, nombre, segundos):
+        with self._lock:
+            self._muestras.setdefault(nombre, []).append(segundos)
+
+    @contextmanager
+    def medir(self, nombre):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(nombre, time.perf_counter() - inicio)
+
+    def sumar(self, nombre, cantidad=1):
+        with self._lock:
+            self._contadores[nombre] = self._contadores.get(nombre, 0) + cantidad
+
+    def muestras(self):
+        """Copia de ``{nombre: [segundos]}``, p. ej. para enviarla desde otro proceso."""
+        with self._lock:
+            return {nombre: list(valores) for nombre, valores in self._muestras.items()}
+
+    def combinar(self, muestras):
+        """Añade las duraciones de :meth:`muestras` tomadas en otro registro."""
+        with self._lock:
+            for nombre, valores in muestras.items():
+                self._muestras.setdefault(nombre, []).extend(valores)
+
+    def terminar(self):
+        """Fija el final de la ejecución; el rendimiento se calcula sobre esa duración."""
+        self._fin = time.perf_counter()
+
+    def resumen(self, precios=None):
+        """Percentiles y rendimiento por métrica, contadores y costo estimado.
+
+        ``precios`` es ``{"entrada", "salida"}`` en dólares por millón de
+        tokens, aplicado a los contadores ``tokens.entrada`` y ``tokens.salida``;
+        ``costo_por_tipo`` lo reparte según ``tokens.entrada.<tipo>`` y
+        ``tokens.salida.<tipo>``.
+        """
+        duracion = (self._fin or time.perf_counter()) - self._inicio
+        with self._lock:
+            muestras = {nombre: sorted(valores) for nombre, valores in self._muestras.items()}
+            contadores = dict(self._contadores)
+        tiempos = {}
+        for nombre, valores in sorted(muestras.items()):
+            total = sum(valores)
+            tiempos[nombre] = {
+                "n": len(valores),
+                "total": total,
+                "media": total / len(valores),
+                **{f"p{p}": _percentil(valores, p) for p in _PERCENTILES},
+                "max": valores[-1],
+                "por_segundo": len(valores) / duracion if duracion else 0.0,
+            }
+        resumen = {"duracion": duracion, "tiempos": tiempos, "contadores": contadores}
+        if precios:
+            resumen["costo"] = (contadores.get("tokens.entrada", 0) * precios["entrada"]
+                                + contadores.get("tokens.salida", 0) * precios["salida"]) / 1_000_000
+            costo_por_tipo = {}
+            for nombre, valor in contadores.items():
+                partes = nombre.split(".", 2)
+                if len(partes) == 3 and partes[0] == "tokens" and partes[1] in precios:
+                    costo_por_tipo[partes[2]] = costo_por_tipo.get(partes[2], 0.0) + valor * precios[partes[1]] / 1_000_000
+            resumen["costo_por_tipo"] = costo_por_tipo
+        return resumen
+
+    def a_json(self, precios=None):
+        return json.dumps(self.resumen(precios), ensure_ascii=False, indent=1)
+
+    def a_csv(self, precios=None):
+        """Una fila por métrica de tiempo y una por contador."""
+        resumen = self.resumen(precios)
+        columnas = ["n", "total", "media"] + [f"p{p}" for p in _PERCENTILES] + ["max", "por_segundo"]
+        salida = io.StringIO()
+        escritor = csv.writer(salida)
+        escritor.writerow(["metrica", "clase"] + columnas)
+        for nombre, valores in resumen["tiempos"].items():
+            escritor.writerow([nombre, "segundos"] + [f"{valores[c]:.6g}" for c in columnas])
+        for nombre, valor in sorted(resumen["contadores"].items()):
+            escritor.writerow([nombre, "contador", "", valor] + [""] * (len(columnas) - 2))
+        escritor.writerow(["duracion", "segundos", "", f"{resumen['duracion']:.6g}"] + [""] * (len(columnas) - 2))
+        if "costo" in resumen:
+            escritor.writerow(["costo", "usd", "", f"{resumen['costo']:.6g}"] + [""] * (len(columnas) - 2))
+        return salida.getvalue()
+
+    def guardar(self, ruta_json, ruta_csv=None, precios=None):
+        with open(ruta_json, "w", encoding="utf-8") as archivo:
+            archivo.write(self.a_json(precios))
+        if ruta_csv:
+            with open(ruta_csv, "w", encoding="utf-8", newline="") as archivo:
+                archivo.write(self.a_csv(precios))
+
+
+class _TelemetriaNula:
+    """Mismo interfaz que :class:`Telemetria`, sin costo: para cuando no se mide."""
+
+    def observar(self, nombre, segundos):
+        pass
+
+    @contextmanager
+    def medir(self, nombre):
+        yield
+
+    def sumar(self, nombre, cantidad=1):
+        pass
+
+    def combinar(self, muestras):
+        pass
+
+
+NULA = _TelemetriaNula()
+
+
+@contextmanager
+def perfil(ruta=None):
+    """Perfila con cProfile el hilo actual y guarda el resultado en ``ruta`` (.prof); sin ruta no hace nada.
+
+    Junto al .prof se escribe ``<ruta>.txt`` con las 40 funciones de mayor
+    tiempo acumulado.
+    """
+    if ruta is None:
+        yield
+        return
+    import cProfile
+    import pstats
+
+    perfilador = cProfile.Profile()
+    perfilador.enable()
+    try:
+        yield
+    finally:
+        perfilador.disable()
+        perfilador.dump_stats(ruta)
+        with open(ruta + ".txt", "w", encoding="utf-8") as archivo:
+            pstats.Stats(perfilador, stream=archivo).sort_stats("cumulative").print_stats(40)
@@ -1,12 +1,28 @@
 import streamlit as st
 import pandas as pd
-from docxtpl import DocxTemplate
-import google.generativeai as genai
 import os
-import re
-import time
-import zipfile
-from io import BytesIO
+import secrets
+
+from ensamblador.artefactos import MAX_MB_EXPORTACIONES, CacheArtefactos, huella
+from ensamblador.bitacora import Bitacora, recuperar, ruta_bitacora
+from ensamblador.cache import MAX_DIAS_POR_DEFECTO, MAX_MB_POR_DEFECTO, CacheRespuestas
+from ensamblador.exportacion import UMBRAL_MEMORIA_POR_DEFECTO, exportar_excel
+from ensamblador.flujo import Configuracion, firma_ejecucion
+from ensamblador.limitador import RPM_POR_DEFECTO, TPM_POR_DEFECTO
+from ensamblador.modelo import setup_model
+from ensamblador.motor import ANALISIS, CONCURRENCIA_POR_DEFECTO, RECOMENDACIONES, filas_con_error
+from ensamblador.prompts import COLUMNAS_PROMPT, PRESUPUESTO_TOKENS_POR_DEFECTO
+from ensamblador.tareas import (
+    COMPLETADA,
+    ENRIQUECIMIENTO,
+    ENSAMBLAJE,
+    FALLIDA,
+    GestorTareas,
+    clave_resultado,
+    ejecutar_enriquecimiento,
+    ejecutar_ensamblaje,
+    excel_limpio,
+)
 
 # --- CONFIGURACIÓN DE LA PÁGINA DE STREAMLIT ---
 st.set_page_config(
@@ -15,205 +31,42 @@ st.set_page_config(
     layout="wide"
 )
 
-# --- FUNCIONES DE LÓGICA (sin cambios) ---
-
-def limpiar_html(texto_html):
-    if not isinstance(texto_html, str):
-        return texto_html
-    cleanr = re.compile('<.*?>')
-    texto_limpio = re.sub(cleanr, '', texto_html)
-    return texto_limpio
+# --- FUNCIONES DE LÓGICA ---
+# La lógica vive en el paquete ``ensamblador`` (también usable desde la línea de comandos).
 
-def setup_model(api_key):
+def cargar_modelo(api_key):
     try:
-        genai.configure(api_key=api_key)
-        generation_config = {
-            "temperature": 0.6, "top_p": 1, "top_k": 1, "max_output_tokens": 8192
-        }
-        safety_settings = [
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        ]
-        model = genai.GenerativeModel(
-            model_name="gemini-1.5-pro-latest",
-            generation_config=generation_config,
-            safety_settings=safety_settings
-        )
-        return model
+        return setup_model(api_key)
     except Exception as e:
         st.error(f"Error al configurar la API de Google: {e}")
         return None
 
-def construir_prompt_analisis(fila, prompt_adicional=""):
-    fila = fila.fillna('')
-    descripcion_item = (
-        f"Enunciado: {fila.get('Enunciado', '')}\n"
-        f"A. {fila.get('OpcionA', '')}\n" # Asegúrate de que el Excel tenga 'OpcionA', 'OpcionB', etc.
-        f"B. {fila.get('OpcionB', '')}\n"
-        f"C. {fila.get('OpcionC', '')}\n"
-        f"D. {fila.get('OpcionD', '')}\n"
-        f"Respuesta correcta: {fila.get('AlternativaClave', '')}"
-    )
-    return f"""
-🎯 ROL DEL SISTEMA
-Eres un experto en evaluación educativa con un profundo conocimiento de la pedagogía urbana, especializado en enseñanza de las matematicas y procesos cognitivos en el contexto de Bogotá. Tu misión es analizar un ítem de evaluación para proporcionar un análisis tripartito: un resumen de lo que evalúa, la ruta cognitiva detallada para la respuesta correcta, y un análisis de los errores asociados a las opciones incorrectas.
-
-🧠 INSUMOS DE ENTRADA
-- Texto/Fragmento: {fila.get('ItemContexto', 'No aplica')}
-- Descripción del Ítem: {fila.get('Pregunta', 'No aplica')}
-- Imagen asociada al ítem {fila.get('Imagen_pregunta', 'No aplica')}
-- Componente: {fila.get('ComponenteNombre', 'No aplica')}
-- Competencia: {fila.get('CompetenciaNombre', '')}
-- Aprendizaje Priorizado: {fila.get('AfirmacionNombre', '')}
-- Evidencia de Aprendizaje: {fila.get('EvidenciaNombre', '')}
-- Grado Escolar: {fila.get('ItemGradoId', '')}
-- Opción A. {fila.get('OpcionA', '')}\n"
-- Opción B. {fila.get('OpcionB', '')}\n"
-- Opción C. {fila.get('OpcionC', '')}\n"
-- Opción D. {fila.get('OpcionD', '')}\n"
-- Respuesta correcta: {fila.get('AlternativaClave', '')}"
-
-
-🎯 ROL DEL SISTEMA
-Eres un experto en evaluación educativa con un profundo conocimiento de la pedagogía urbana, especializado en enseñanza de las matemáticas y procesos cognitivos en el contexto educativo de Bogotá. Tu misión es analizar un ítem de evaluación para proporcionar un análisis tripartito: 1. Resumen del objetivo del ítem: Explica brevemente qué habilidad, conocimiento o competencia se está evaluando. 2.  Ruta cognitiva para la respuesta correcta: Describe detalladamente el razonamiento y los pasos que un estudiante debería seguir para llegar a la respuesta válida. 3. Análisis de las respuestas incorrectas: Explica los errores comunes asociados a cada opción no válida, indicando por qué un estudiante podría elegirla y en qué radica la equivocación.
-
-🧠 INSUMOS DE ENTRADA
-- Texto/Fragmento: {fila.get('ItemContexto', 'No aplica')}
-- Descripción del Ítem: {fila.get('Pregunta', 'No aplica')}
-- Imagen asociada al ítem {fila.get('Imagen_pregunta', 'No aplica')}
-- Componente: {fila.get('ComponenteNombre', 'No aplica')}
-- Competencia: {fila.get('CompetenciaNombre', '')}
-- Aprendizaje Priorizado: {fila.get('AfirmacionNombre', '')}
-- Evidencia de Aprendizaje: {fila.get('EvidenciaNombre', '')}
-- Grado Escolar: {fila.get('ItemGradoId', '')}
-- Opción A. {fila.get('OpcionA', '')}\n"
-- Opción B. {fila.get('OpcionB', '')}\n"
-- Opción C. {fila.get('OpcionC', '')}\n"
-- Opción D. {fila.get('OpcionD', '')}\n"
-- Respuesta correcta: {fila.get('AlternativaClave', '')}"
-
-
-📝 INSTRUCCIONES PARA EL ANÁLISIS DEL ÍTEM
-Genera el análisis del ítem siguiendo estas reglas y en el orden exacto solicitado:
-
-### 1. Qué Evalúa
-Basándote en la Competencia, el Aprendizaje Priorizado y la Evidencia, redacta una frase concisa y clara (máximo 2 renglones) que identifique con claridad la habilidad específica que el ítem está evaluando. Debes comenzar la frase obligatoriamente con "El ítem evalúa la capacidad del estudiante para...".
-
-### 2. Ruta Cognitiva Correcta
-Describe de forma impersonal el procedimiento o el paso a paso lógico y cognitivo que un estudiante debe seguir para llegar a la respuesta correcta. La explicación debe ser clara y basarse en los verbos del `CRITERIO COGNITIVO` que se define más abajo.
-
-### 3. Análisis de Opciones No Válidas
-Para cada una de las TRES opciones incorrectas o no validas, explica el posible razonamiento erróneo del estudiante. Describe la confusión o el error conceptual que lo llevaría a elegir esa opción y luego clarifica por qué es incorrecta.
-
-📘 CRITERIO COGNITIVO PARA MATEMÁTICAS
-Para orientar el análisis del ítem, identifica la competencia principal que está en el ítem y selecciona los verbos cognitivos más adecuados según el tipo de habilidad evaluada. A continuación, se presentan tres dominios cognitivos, cada uno con una lista de verbos organizados por niveles de complejidad:
-
-1. Interpretación y Comunicación (Comprender y representar información)
-Verbos de menor complejidad (FORTALECER): identificar, leer (datos, gráficos), reconocer, nombrar, contar, localizar, señalar.
-Verbos de mayor complejidad (AVANZAR): representar (en gráficos, tablas), describir, comparar, clasificar, organizar, traducir (de lenguaje verbal a matemático).
-
-2. Formulación y Solución de Problemas (Aplicar procedimientos y estrategias)
-Verbos de menor complejidad (FORTALECER): calcular, medir, aplicar (una fórmula), resolver (operaciones directas), completar (secuencias), usar (un algoritmo).
-Verbos de mayor complejidad (AVANZAR): formular (un plan o ecuación), plantear, modelar, diseñar (una estrategia), optimizar, descomponer (un problema).
-
-3. Argumentación (Justificar y validar procesos y resultados)
-Verbos de menor complejidad (FORTALECER): verificar, explicar (los pasos), mostrar, relacionar, ejemplificar.
-Verbos de mayor complejidad (AVANZAR): justificar (un método), validar (un resultado), probar, generalizar, demostrar, evaluar (la pertinencia de una solución).
-
-✍️ FORMATO DE SALIDA DEL ANÁLISIS
-**REGLA CRÍTICA:** Responde únicamente con el texto solicitado y siguiendo estrictamente la estructura definida a continuación. Es crucial que los tres títulos aparezcan en la respuesta, en el orden correcto. No agregues introducciones, conclusiones ni frases de cierre.
-
-Qué Evalúa:
-[Frase concisa de 1-2 renglones, que comience con: “El ítem evalúa la capacidad del estudiante para…”]]  
-
-Ruta Cognitiva Correcta:
-[Escribe un párrafo continuo que describa de forma clara y secuencial el proceso cognitivo que un estudiante debe seguir para responder correctamente. No utilices listas.]
-
-Análisis de Opciones No Válidas:
-- El estudiante podría escoger la [OpcionX] porque [razonamiento erróneo]. Sin embargo, esto es incorrecto porque [razón].
-"""
-
-def construir_prompt_recomendaciones(fila, prompt_adicional=""):
-    fila = fila.fillna('')
-    return f"""
-🎯 ROL DEL SISTEMA
-Eres un experto en evaluación educativa especializado en enseñanza de las matematicas con un profundo conocimiento de la pedagogía urbana. Tu misión es generar dos recomendaciones pedagógicas personalizadas a partir de cada ítem de evaluación formativa: una para Fortalecer y otra para Avanzar en el aprendizaje. Deberás identificar de manera endógena los verbos clave de los procesos cognitivos implicados, basándote en la competencia, el aprendizaje priorizado, la evidencia de aprendizaje, el grado escolar, la edad escolar y aproximada del estudiante (para gado 3 niños de 9 a 11 años, grado 6 de 11 a 13 años, grado noveno de 13 a 15 años) y El nivel educativo general esperado para el ciclo escolar correspondiente. Luego, integrarás estos verbos de forma fluida en la redacción de las recomendaciones. Considerarás las características cognitivas y pedagógicas del ítem. Las recomendaciones deben estar redactadas de forma fluida e integrar los verbos cognitivos de manera contextualizada y coherente, sin mencionarlos explícitamente como parte de una lista. Cada sugerencia debe orientar al docente sobre cómo diseñar o ajustar actividades didácticas que respondan al nivel de complejidad requerido y promuevan un aprendizaje progresivo. Las resomendaciones deben estar escritas de forma impersonal sin nombrar al docente o al estudiante.
-
-🧠 INSUMOS DE ENTRADA
-- Texto/Fragmento: {fila.get('ItemContexto', 'No aplica')}
-- Descripción del Ítem: {fila.get('Pregunta', 'No aplica')}
-- Imagen asociada al ítem {fila.get('Imagen_pregunta', 'No aplica')}
-- Componente: {fila.get('ComponenteNombre', 'No aplica')}
-- Competencia: {fila.get('CompetenciaNombre', '')}
-- Aprendizaje Priorizado: {fila.get('AfirmacionNombre', '')}
-- Evidencia de Aprendizaje: {fila.get('EvidenciaNombre', '')}
-- Tipología Textual (Solo para Lectura Crítica): {fila.get('Tipologia Textual', 'No aplica')}
-- Grado Escolar: {fila.get('ItemGradoId', '')}
-- Respuesta correcta: {fila.get('AlternativaClave', 'No aplica')}
-- Opción A. {fila.get('OpcionA', 'No aplica')}
-- Opción B. {fila.get('OpcionB', 'No aplica')}
-- Opción C. {fila.get('OpcionC', 'No aplica')}
-- Opción D. {fila.get('OpcionD', 'No aplica')}
-
-📝 INSTRUCCIONES PARA GENERAR LAS RECOMENDACIONES
-Para cada ítem, redacta dos recomendaciones pedagógicas claras, contextualizadas y accionables, orientadas a mejorar el aprendizaje matemático desde distintos niveles cognitivos teniendo en cuenta los siguientes criterios:
-
-### Reglas Generales Clave:
-1.  **Innovación Pedagógica:** Las actividades deben ser **novedosas, poco convencionales y creativas**. Busca inspiración en temas de actualidad (tecnología, medio ambiente, cultura popular, etc.) para que sean significativas y atractivas.
-2.  **Enfoque Matemático:** El núcleo de cada actividad debe ser el concepto matemático. Los elementos contextuales o lúdicos deben servir para potenciar el aprendizaje matemático, no para opacarlo. La logística debe ser ser sencilla y factible.
-3.  **Diferenciación Clara:** La actividad de "Fortalecer" debe ser fundamentalmente diferente en enfoque y ejecución a la de "Avanzar".
-4.  **Tono de la redacción:** Evita mencionar sujetos específicos como “el docente” o “el estudiante”. Redacta las actividades de forma impersonal y directa, enfocada en la acción y el propósito pedagógico.
-
-### 1. Recomendación para FORTALECER
--   **Objetivo:**  Reforzar los procesos cognitivos básico esenciales para la resolución del ítem. 
--   **Tener en cuenta:**. Se pueden tener en cuenta , pero no limitarse a, las **opciones de respuesta incorrectas**. Tener en cuenta los errores conceptuales o procedimentales identificados en las opciones incorrectas del ítem. Considerar adicionalmente el alcance que tiene el aprendizaje priorizado y la evidencia de aprendizaje mas allá del ítem.
--   **Verbos Clave Sugeridos:** Utiliza verbos descritos en CRITERIO COGNITIVO PARA MATEMÁTICAS que están mas adelante.
--   **Párrafo Inicial:** Describe brevemente la estrategia didáctica propuesta y explica cómo aborda el error más frecuente evidenciado en los distractores. Describe la estrategia didáctica, explicando cómo la actividad propuesta ataca directamente la raíz del error más común (identificado en las opciones no válidas).
--   **Actividad Propuesta:** Diseña una experiencia concreta, lúdica y significativa. Debe estar profundamente contextualizada en una situación cotidiana, real o escolar o de interés para los estudiantes.
--   **Preguntas Orientadoras:** Formula tres preguntas que guíen el aprendizaje desde lo más básico (concreto) hacia la comprensión del concepto.
--   **Edad de los evaluados:**  Asegura que el nivel cognitivo de la actividad corresponda con la edad y grado escolar del estudiante:. (para gado 3 niños de 9 a 11 años, grado 6 de 11 a 13 años, grado noveno de 13 a 15 años)
-
-### 2. Recomendación para AVANZAR
--   **Objetivo:** Desarrollar procesos cognitivos más complejos que permitan **ampliar, profundizar o transferir** el aprendizaje evaluado.
--   **Verbos Clave Sugeridos:** Emplea verbos de mayor nivel descritos en CRITERIO COGNITIVO PARA MATEMÁTICAS que están mas adelante.
--   **Párrafo Inicial:** Describe la estrategia para complejizar el aprendizaje. Redacta la estrategia teniendo en cuenta que se puede dar en tres vías diferentes: a. Progresar a partir del tipo de número utilizado en el objeto matemático; por ejemplo, si se trabaja con números naturales, avanzar hacia el uso de fracciones o decimales. b. Ampliar el objeto matemático relacionado; por ejemplo, si se interpreta información de una tabla a un diagrama de barras, avanzar hacia la interpretación de un diagrama de barras a uno circular, o de una lista a un pictograma y viceversa o c. Promover un avance en las operaciones intelectuales o procesos de pensamiento, pasando de identificar a diferenciar o corregir, siempre manteniendo la competencia. Incluye múltiples vías en las que se puede profundizar el conocimiento (ej., "se puede transferir a un problema de finanzas personales, a un desafío de diseño o a un análisis de datos simple...").
--   **Actividad Propuesta:** Crea una actividad totalmente diferente a la de fortalecer, orientado con el objetivo de la recomendación,con un desafío intelectual autentico y estimulante.  Integra de manera creativa elementos actuales o relevantes para los estudiantes.
--   **Preguntas Orientadoras:** Formula preguntas que progresen en dificultad, facilitando el paso de representaciones concretas a abstractas y fomentando el pensamiento crítico y la generalización.
--   **Edad de los evaluados:**  Ajusta el nivel de complejidad de la propuesta a la edad y grado correspondiente:(para gado 3 niños de 9 a 11 años, grado 6 de 11 a 13 años, grado noveno de 13 a 15 años)
--   **Estrategias para crear actividades de avanzar:** a. Progresar a partir del tipo de número utilizado en el objeto matemático; por ejemplo, si se trabaja con números naturales, avanzar hacia el uso de fracciones o decimales. b. Ampliar el objeto matemático relacionado; por ejemplo, si se interpreta información de una tabla a un diagrama de barras, avanzar hacia la interpretación de un diagrama de barras a uno circular, o de una lista a un pictograma y viceversa. c. Promover un avance en las operaciones intelectuales o procesos de pensamiento, pasando de identificar a diferenciar o corregir, siempre manteniendo la competencia.
-
-📘 CRITERIO COGNITIVO PARA MATEMÁTICAS
-Identifica la competencia principal del ítem y selecciona los verbos cognitivos adecuados de las siguientes listas. Para FORTALECER, elige un verbo que refleje un proceso fundamental o de entrada. Para AVANZAR, selecciona un verbo que implique una mayor elaboración o transferencia del conocimiento.
-
-1. Interpretación y Comunicación (Comprender y representar información)
-Verbos de menor complejidad (FORTALECER): identificar, leer (datos, gráficos), reconocer, nombrar, contar, localizar, señalar.
-Verbos de mayor complejidad (AVANZAR): representar (en gráficos, tablas), describir, comparar, clasificar, organizar, traducir (de lenguaje verbal a matemático).
-
-2. Formulación y Solución de Problemas (Aplicar procedimientos y estrategias)
-Verbos de menor complejidad (FORTALECER): calcular, medir, aplicar (una fórmula), resolver (operaciones directas), completar (secuencias), usar (un algoritmo).
-Verbos de mayor complejidad (AVANZAR): formular (un plan o ecuación), plantear, modelar, diseñar (una estrategia), optimizar, descomponer (un problema).
-
-3. Argumentación (Justificar y validar procesos y resultados)
-Verbos de menor complejidad (FORTALECER): verificar, explicar (los pasos), mostrar, relacionar, ejemplificar.
-Verbos de mayor complejidad (AVANZAR): justificar (un método), validar (un resultado), probar, generalizar, demostrar, evaluar (la pertinencia de una solución).
-
-✍️ FORMATO DE SALIDA DE LAS RECOMENDACIONES
-**IMPORTANTE: Responde de forma directa, concreta y de forma impersonal. No incluyas frases de cierre o resúmenes. Cada recomendación debe seguir esta estructura exacta:**
-
-RECOMENDACIÓN PARA [FORTALECER/AVANZAR] EL APRENDIZAJE EVALUADO EN EL ÍTEM
-Para [fortalecer/avanzar] en la habilidad de [verbo clave] en situaciones relacionadas con [frase del aprendizaje priorizado], se sugiere [descripción concreta de la sugerencia].
-Una actividad que se puede hacer es: [Descripción detallada de la actividad].
-Las preguntas orientadoras para esta actividad, entre otras, pueden ser:
-- [Pregunta 1]
-- [Pregunta 2]
-- [Pregunta 3]
-- [Pregunta 4]
-- [Pregunta 5]
-"""
-
-# --- INTERFAZ PRINCIPAL DE STREAMLIT (CON MODIFICACIONES) ---
+@st.cache_resource
+def obtener_gestor():
+    # Uno por servidor: las tareas siguen vivas entre reruns y recargas; cada una es de su propietario.
+    return GestorTareas()
+
+@st.cache_resource
+def obtener_artefactos():
+    # Excel leído, resultados y ensamblajes, por huella de su contenido.
+    return CacheArtefactos()
+
+@st.cache_resource
+def obtener_exportaciones():
+    # Bytes de los Excel exportados, con su propio presupuesto (menor) para no desalojar los DataFrames.
+    return CacheArtefactos(max_bytes=MAX_MB_EXPORTACIONES * 1024 * 1024)
+
+gestor = obtener_gestor()
+artefactos = obtener_artefactos()
+exportaciones = obtener_exportaciones()
+
+# Token de propietario de las tareas: va en la URL para sobrevivir a las recargas,
+# y cada visitante solo ve, carga, cancela o descarta las tareas con su token.
+if "sesion" not in st.query_params:
+    st.query_params["sesion"] = secrets.token_urlsafe(16)
+propietario = st.query_params["sesion"]
+
+# --- INTERFAZ PRINCIPAL DE STREAMLIT ---
 
 st.title("🤖 Ensamblador de Fichas Técnicas con IA")
 st.markdown("Una aplicación para enriquecer datos pedagógicos y generar fichas personalizadas.")
@@ -221,12 +74,90 @@ st.markdown("Una aplicación para enriquecer datos pedagógicos y generar fichas
 # Inicializar session_state
 if 'df_enriquecido' not in st.session_state:
     st.session_state.df_enriquecido = None
-if 'zip_buffer' not in st.session_state:
-    st.session_state.zip_buffer = None
+if 'huella_df' not in st.session_state:
+    st.session_state.huella_df = None
+if 'zip_volumenes' not in st.session_state:
+    st.session_state.zip_volumenes = None
+if 'manifiesto_zip' not in st.session_state:
+    st.session_state.manifiesto_zip = None
+if 'estadisticas_cache' not in st.session_state:
+    st.session_state.estadisticas_cache = None
+if 'ruta_bitacora' not in st.session_state:
+    st.session_state.ruta_bitacora = None
+if 'excel_parcial' not in st.session_state:
+    st.session_state.excel_parcial = None
+# Tareas en segundo plano lanzadas desde esta sesión.
+if 'tarea_enriquecimiento' not in st.session_state:
+    st.session_state.tarea_enriquecimiento = None
+if 'tarea_ensamblaje' not in st.session_state:
+    st.session_state.tarea_ensamblaje = None
+# Id de la última tarea cargada de cada tipo, para su panel de telemetría.
+if 'tareas_cargadas' not in st.session_state:
+    st.session_state.tareas_cargadas = {}
 
 # --- PASO 0: Clave API ---
 st.sidebar.header("🔑 Configuración Obligatoria")
 api_key = st.sidebar.text_input("Ingresa tu Clave API de Google AI", type="password")
+max_concurrencia = st.sidebar.number_input(
+    "Peticiones simultáneas a la API",
+    min_value=1, max_value=32, value=CONCURRENCIA_POR_DEFECTO,
+    help="Cuántas llamadas a Gemini se mantienen en curso al mismo tiempo."
+)
+tam_lote = st.sidebar.number_input(
+    "Ítems por petición (modo lote)",
+    min_value=1, max_value=10, value=1,
+    help="Con más de 1, cada petición analiza varios ítems y responde en JSON. "
+         "Los ítems cuya respuesta no es válida se reintentan uno a uno. "
+         "Valores altos pueden superar el límite de tokens de salida del modelo."
+)
+umbral_memoria_mb = st.sidebar.number_input(
+    "Memoria máxima por archivo exportado (MB)",
+    min_value=1, value=UMBRAL_MEMORIA_POR_DEFECTO // (1024 * 1024),
+    help="Por encima de este tamaño, el Excel exportado se escribe en disco temporal."
+)
+limite_rpm = st.sidebar.number_input(
+    "Cuota: peticiones por minuto (RPM)",
+    min_value=1, value=RPM_POR_DEFECTO,
+    help="Límite de peticiones por minuto de tu proyecto en Google AI."
+)
+limite_tpm = st.sidebar.number_input(
+    "Cuota: tokens de entrada por minuto (TPM)",
+    min_value=1000, value=TPM_POR_DEFECTO, step=10000,
+    help="Límite de tokens por minuto de tu proyecto en Google AI."
+)
+max_tokens_prompt = st.sidebar.number_input(
+    "Presupuesto de tokens por petición",
+    min_value=1000, value=PRESUPUESTO_TOKENS_POR_DEFECTO, step=1000,
+    help="Estimación de tokens de entrada (instrucciones más datos del ítem). Las filas que lo superan "
+         "no se envían y quedan marcadas como ERROR, para revisarlas antes de gastar cuota."
+)
+
+st.sidebar.header("🗄️ Caché de Respuestas")
+usar_cache = st.sidebar.checkbox(
+    "Guardar respuestas en caché", value=True,
+    help="Reutiliza respuestas ya generadas para el mismo prompt, modelo y configuración."
+)
+omitir_cache = st.sidebar.checkbox(
+    "Ignorar la caché en esta ejecución", value=False, disabled=not usar_cache,
+    help="Vuelve a llamar a la API para todas las filas y actualiza la caché con las respuestas nuevas."
+)
+with st.sidebar.expander("Límites de la caché"):
+    cache_max_mb = st.number_input("Tamaño máximo (MB)", min_value=1, value=MAX_MB_POR_DEFECTO)
+    cache_max_dias = st.number_input("Antigüedad máxima (días)", min_value=1, value=MAX_DIAS_POR_DEFECTO)
+    if st.button("🗑️ Vaciar caché"):
+        cache_ui = CacheRespuestas(max_mb=cache_max_mb, max_dias=cache_max_dias)
+        cache_ui.vaciar()
+        cache_ui.cerrar()
+if st.session_state.estadisticas_cache:
+    estadisticas = st.session_state.estadisticas_cache
+    st.sidebar.caption(f"Última ejecución: {estadisticas['aciertos']} aciertos / {estadisticas['fallos']} fallos de caché.")
+
+st.sidebar.header("📊 Telemetría")
+perfilar = st.sidebar.checkbox(
+    "Perfilar las próximas tareas con cProfile", value=False,
+    help="Guarda un perfil (.prof) del hilo de la tarea: lectura, separación de respuestas, "
+         "renderizado con un proceso y exportación. La latencia de la API se mide siempre."
+)
 
 # --- PASO 1: Carga de Archivos ---
 st.header("Paso 1: Carga tus Archivos")
@@ -236,7 +167,7 @@ with col1:
 with col2:
     archivo_plantilla = st.file_uploader("Sube tu Plantilla de Word", type=["docx"])
 
-# --- NUEVO: PASO 1.5: Prompts Adicionales (Opcional) ---
+# --- PASO 1.5: Prompts Adicionales (Opcional) ---
 st.header("Paso 1.5 (Opcional): Refina los Prompts de la IA")
 with st.expander("Haz clic aquí para añadir instrucciones personalizadas a los prompts"):
     prompt_adicional_analisis = st.text_area(
@@ -251,118 +182,241 @@ with st.expander("Haz clic aquí para añadir instrucciones personalizadas a los
     )
 
 
+
+def configuracion():
+    """Configuración de la ejecución según los controles de la página."""
+    return Configuracion(
+        columna_id=columna_id,
+        max_concurrencia=max_concurrencia,
+        tam_lote=tam_lote,
+        rpm=limite_rpm,
+        tpm=limite_tpm,
+        prompt_adicional_analisis=prompt_adicional_analisis,
+        prompt_adicional_recomendaciones=prompt_adicional_recomendaciones,
+        usar_cache=usar_cache,
+        omitir_cache=omitir_cache,
+        cache_max_mb=cache_max_mb,
+        cache_max_dias=cache_max_dias,
+        deduplicar=deduplicar,
+        max_tokens_prompt=max_tokens_prompt,
+    )
+
+
+def lanzar_enriquecimiento(model, descripcion, **opciones):
+    """Encola el enriquecimiento en segundo plano; la página solo consulta su avance."""
+    tarea = gestor.enviar(ENRIQUECIMIENTO, descripcion, ejecutar_enriquecimiento, model, configuracion(),
+                          propietario=propietario, artefactos=artefactos, perfilar=perfilar, **opciones)
+    st.session_state.tarea_enriquecimiento = tarea.id
+    st.rerun()
+
+
+def usar_resultado(tarea):
+    """Carga en esta sesión el resultado de una tarea completada."""
+    st.session_state.tareas_cargadas[tarea.tipo] = tarea.id
+    if tarea.tipo == ENRIQUECIMIENTO:
+        # Si la tarea corrió en este proceso y la caché no lo descartó, el DataFrame sigue en memoria.
+        df = artefactos.obtener(clave_resultado(tarea), lambda: pd.read_excel(tarea.resultado["excel"]))
+        st.session_state.df_enriquecido = df
+        st.session_state.huella_df = huella(df)
+        st.session_state.ruta_bitacora = tarea.resultado.get("bitacora")
+        st.session_state.estadisticas_cache = tarea.resultado.get("estadisticas_cache")
+    else:
+        st.session_state.zip_volumenes = tarea.resultado["volumenes"]
+        st.session_state.manifiesto_zip = tarea.resultado.get("manifiesto")
+
+
+def ultimo_manifiesto():
+    """Manifiesto del último ensamblaje de esta sesión o, si no lo hay, del más reciente de este propietario."""
+    candidatos = [st.session_state.manifiesto_zip] + [
+        tarea.resultado.get("manifiesto") for tarea in gestor.listar(propietario)
+        if tarea.tipo == ENSAMBLAJE and tarea.estado == COMPLETADA
+    ]
+    return next((ruta for ruta in candidatos if ruta and os.path.exists(ruta)), None)
+
+
+def mostrar_telemetria(tarea):
+    """Resumen de tiempos, tokens y costo de una tarea, con sus archivos para descargar."""
+    resumen = tarea.resultado.get("telemetria")
+    if not resumen:
+        return
+    contadores = resumen["contadores"]
+    tiempos = resumen["tiempos"]
+    st.subheader(tarea.descripcion)
+    col_duracion, col_ritmo, col_tokens, col_costo = st.columns(4)
+    col_duracion.metric("Duración", f"{resumen['duracion']:.1f} s")
+    if tarea.tipo == ENRIQUECIMIENTO:
+        llamadas = sum(valores["n"] for nombre, valores in tiempos.items() if nombre.startswith("api."))
+        col_ritmo.metric("Llamadas a la API", llamadas, help=f"{llamadas / max(resumen['duracion'], 1e-9):.2f} por segundo")
+        col_tokens.metric("Tokens entrada / salida", f"{contadores.get('tokens.entrada', 0):,} / {contadores.get('tokens.salida', 0):,}")
+        col_costo.metric("Costo estimado (USD)", f"{resumen.get('costo', 0):.4f}",
+                         help=" · ".join(f"{tipo}: {costo:.4f}" for tipo, costo in sorted(resumen.get("costo_por_tipo", {}).items())) or None)
+    else:
+        fichas = tiempos.get("ensamblaje.render", {}).get("n", 0) + tiempos.get("ensamblaje.copia", {}).get("n", 0)
+        col_ritmo.metric("Fichas por segundo", f"{fichas / max(resumen['duracion'], 1e-9):.1f}")
+        col_tokens.metric("Renderizadas", tiempos.get("ensamblaje.render", {}).get("n", 0))
+        col_costo.metric("Copiadas sin cambios", tiempos.get("ensamblaje.copia", {}).get("n", 0))
+    if tiempos:
+        st.dataframe(pd.DataFrame.from_dict(tiempos, orient="index"))
+    if contadores:
+        st.caption(" · ".join(f"{nombre}: {valor:,}" for nombre, valor in sorted(contadores.items())))
+
+    descargas = [("telemetria.json", "application/json"), ("telemetria.csv", "text/csv"), ("perfil.prof", "application/octet-stream")]
+    columnas = st.columns(len(descargas))
+    for columna, (nombre, mime) in zip(columnas, descargas):
+        if os.path.exists(tarea.ruta(nombre)):
+            with open(tarea.ruta(nombre), "rb") as archivo:
+                columna.download_button(f"📥 {nombre}", archivo, file_name=f"{tarea.tipo}_{nombre}", mime=mime,
+                                        key=f"telemetria_{tarea.id}_{nombre}")
+    if os.path.exists(tarea.ruta("perfil.prof.txt")):
+        with st.expander("Perfil de cProfile (40 funciones con más tiempo acumulado)"):
+            with open(tarea.ruta("perfil.prof.txt"), encoding="utf-8") as archivo:
+                st.text(archivo.read())
+
+
+def mostrar_tarea(tarea, clave):
+    st.progress(tarea.progreso, text=f"{tarea.descripcion} — {tarea.estado}: {tarea.hechos}/{tarea.total}. {tarea.mensaje}")
+    for aviso in tarea.avisos:
+        st.caption(aviso)
+    if tarea.errores:
+        with st.expander(f"⚠️ Últimos errores ({len(tarea.errores)})"):
+            st.text("\n".join(tarea.errores))
+    if not tarea.terminada and st.button("⏹️ Cancelar", key=f"cancelar_{clave}_{tarea.id}"):
+        gestor.cancelar(tarea.id, propietario)
+
+
+hay_tareas_activas = any(not tarea.terminada for tarea in gestor.listar(propietario))
+
+
+# Se vuelve a ejecutar solo cada pocos segundos mientras haya tareas activas,
+# sin rehacer el resto de la página.
+@st.fragment(run_every=2 if hay_tareas_activas else None)
+def panel_tareas():
+    for clave in ("tarea_enriquecimiento", "tarea_ensamblaje"):
+        tarea = gestor.obtener(st.session_state[clave], propietario) if st.session_state[clave] else None
+        if tarea is None:
+            continue
+        mostrar_tarea(tarea, clave)
+        if tarea.terminada:
+            st.session_state[clave] = None
+            if tarea.estado == COMPLETADA:
+                usar_resultado(tarea)
+                st.rerun()
+            elif tarea.estado == FALLIDA:
+                st.error(f"La tarea falló: {tarea.mensaje}")
+
+    tareas = gestor.listar(propietario)
+    if tareas:
+        with st.expander(f"🗂️ Tareas en segundo plano ({len(tareas)})"):
+            for tarea in tareas:
+                mostrar_tarea(tarea, "lista")
+                if tarea.estado == COMPLETADA and st.button("📂 Usar este resultado", key=f"usar_{tarea.id}"):
+                    usar_resultado(tarea)
+                    st.rerun()
+                if tarea.terminada and st.button("🗑️ Descartar", key=f"descartar_{tarea.id}"):
+                    gestor.descartar(tarea.id, propietario)
+                    st.rerun()
+
+
 # --- PASO 2: Enriquecimiento con IA ---
 st.header("Paso 2: Enriquece tus Datos con IA")
+col_id, col_reanudar = st.columns(2)
+with col_id:
+    columna_id = st.text_input(
+        "Columna que identifica cada fila (para reanudar ejecuciones)", value="ItemId",
+        help="Si la columna no existe o tiene valores repetidos se usa el número de fila."
+    )
+with col_reanudar:
+    reanudar_ejecucion = st.checkbox(
+        "Reanudar desde los resultados guardados", value=True,
+        help="Omite las filas que ya se generaron en una ejecución anterior con este mismo Excel, "
+             "los mismos prompts, modelo y ítems por petición."
+    )
+    deduplicar = st.checkbox(
+        "Generar una sola vez los ítems repetidos", value=True,
+        help="Las filas cuyos campos de prompt son idénticos (p. ej. el mismo ítem en otra forma "
+             "o cuadernillo) comparten el resultado de una sola llamada a la API."
+    )
+    solo_columnas_prompt = st.checkbox(
+        "Leer solo las columnas que usan los prompts", value=False,
+        help="Acelera la carga de libros muy grandes. Las demás columnas no estarán "
+             "disponibles en el Excel enriquecido ni en la plantilla de Word."
+    )
+    solo_errores = st.checkbox(
+        "El Excel ya está enriquecido: regenerar solo las filas con ERROR", value=False,
+        help="Para un Excel descargado de una ejecución anterior: las filas bien generadas se "
+             "conservan y solo se vuelven a pedir las celdas marcadas como ERROR."
+    )
+columnas_lectura = COLUMNAS_PROMPT + [columna_id] if solo_columnas_prompt else None
+
+# Resultados guardados de una ejecución anterior con este mismo archivo y la misma configuración.
+ruta_bitacora_excel = ruta_bitacora(archivo_excel.getvalue(), firma_ejecucion(configuracion())) if archivo_excel else None
+if ruta_bitacora_excel and os.path.exists(ruta_bitacora_excel) and os.path.getsize(ruta_bitacora_excel) > 0:
+    st.info("Hay resultados guardados de una ejecución anterior con este Excel y esta configuración de prompts.")
+    col_parcial, col_descartar = st.columns(2)
+    with col_parcial:
+        if st.button("📦 Preparar Excel parcial"):
+            df_parcial = excel_limpio(artefactos, archivo_excel.getvalue(), columnas_lectura).copy()
+            _, recuperados = recuperar(df_parcial, ruta_bitacora_excel, columna_id)
+            # st.download_button no acepta un SpooledTemporaryFile: se le pasan sus bytes.
+            with exportar_excel(df_parcial, umbral_memoria=umbral_memoria_mb * 1024 * 1024) as archivo:
+                st.session_state.excel_parcial = archivo.read()
+            st.caption(f"{recuperados} resultado(s) recuperado(s).")
+        if st.session_state.excel_parcial is not None:
+            st.download_button(
+                label="📥 Descargar Excel parcial",
+                data=st.session_state.excel_parcial,
+                file_name="excel_enriquecido_parcial.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
+    with col_descartar:
+        if st.button("🗑️ Descartar resultados guardados"):
+            bitacora_excel = Bitacora(ruta_bitacora_excel)
+            bitacora_excel.descartar()
+            bitacora_excel.cerrar()
+            st.session_state.excel_parcial = None
+            st.rerun()
+
 if st.button("🤖 Iniciar Análisis y Generación", disabled=(not api_key or not archivo_excel)):
-    # ... (El resto del código del botón y los pasos 3, 4, y 5 se mantienen igual)
-    # PERO se deben pasar los prompts adicionales a las funciones de generación
-    
     if not api_key:
         st.error("Por favor, ingresa tu clave API en la barra lateral izquierda.")
     elif not archivo_excel:
         st.warning("Por favor, sube un archivo Excel para continuar.")
     else:
-        model = setup_model(api_key)
+        model = cargar_modelo(api_key)
         if model:
-            # (El resto del código de esta sección se mantiene igual, 
-            # solo asegúrate de pasar los prompts adicionales al llamar a las funciones)
-            # Ejemplo de cómo se llamaría la función dentro del bucle:
-            # prompt = construir_prompt_analisis(fila, prompt_adicional_analisis)
-            # ...
-            # y
-            # prompt = construir_prompt_recomendaciones(fila, prompt_adicional_recomendaciones)
-            # ...
-            # A continuación el código completo de esta sección:
-
-            with st.spinner("Procesando archivo Excel y preparando datos..."):
-                df = pd.read_excel(archivo_excel)
-                for col in df.columns:
-                    if df[col].dtype == 'object':
-                        df[col] = df[col].apply(limpiar_html)
-                st.success("Datos limpios y listos para el análisis.")
-
-            total_filas = len(df)
-            
-            # Proceso de Análisis
-            with st.spinner("Generando Análisis de Ítems..."):
-                # ... (código interno sin cambios, solo la llamada a la función)
-                # ...
-                que_evalua_lista, just_correcta_lista, an_distractores_lista = [], [], []
-                progress_bar_analisis = st.progress(0, text="Iniciando Análisis...")
-                for i, fila in df.iterrows():
-                    prompt = construir_prompt_analisis(fila, prompt_adicional_analisis)
-                    # (El resto del try/except se mantiene igual)
-                    try:
-                        response = model.generate_content(prompt)
-                        texto_completo = response.text.strip()
-                        header_que_evalua = "Qué Evalúa:"
-                        header_correcta = "Ruta Cognitiva Correcta:"
-                        header_distractores = "Análisis de Opciones No Válidas:"
-                        idx_correcta = texto_completo.find(header_correcta)
-                        idx_distractores = texto_completo.find(header_distractores)
-                        que_evalua = texto_completo[len(header_que_evalua):idx_correcta].strip() if idx_correcta != -1 else texto_completo
-                        just_correcta = texto_completo[idx_correcta:idx_distractores].strip() if idx_correcta != -1 and idx_distractores != -1 else (texto_completo[idx_correcta:].strip() if idx_correcta != -1 else "ERROR")
-                        an_distractores = texto_completo[idx_distractores:].strip() if idx_distractores != -1 else "ERROR"
-                    except Exception as e:
-                        st.warning(f"Error en fila {i+1} (Análisis): {e}")
-                        que_evalua, just_correcta, an_distractores = "ERROR API", "ERROR API", "ERROR API"
-                    
-                    que_evalua_lista.append(que_evalua)
-                    just_correcta_lista.append(just_correcta)
-                    an_distractores_lista.append(an_distractores)
-                    progress_bar_analisis.progress((i + 1) / total_filas, text=f"Analizando Ítem {i+1}/{total_filas}")
-                    time.sleep(1)
-                
-                df["Que_Evalua"] = que_evalua_lista
-                df["Justificacion_Correcta"] = just_correcta_lista
-                df["Analisis_Distractores"] = an_distractores_lista
-                st.success("Análisis de Ítems completado.")
-
-            # Proceso de Recomendaciones
-            with st.spinner("Generando Recomendaciones Pedagógicas..."):
-                # ... (código interno sin cambios, solo la llamada a la función)
-                # ...
-                fortalecer_lista, avanzar_lista = [], []
-                progress_bar_recom = st.progress(0, text="Iniciando Recomendaciones...")
-                for i, fila in df.iterrows():
-                    prompt = construir_prompt_recomendaciones(fila, prompt_adicional_recomendaciones)
-                    # (El resto del try/except se mantiene igual)
-                    try:
-                        response = model.generate_content(prompt)
-                        texto_completo = response.text.strip()
-                        titulo_avanzar = "RECOMENDACIÓN PARA AVANZAR"
-                        idx_avanzar = texto_completo.upper().find(titulo_avanzar)
-                        if idx_avanzar != -1:
-                            fortalecer = texto_completo[:idx_avanzar].strip()
-                            avanzar = texto_completo[idx_avanzar:].strip()
-                        else:
-                            fortalecer, avanzar = texto_completo, "ERROR: No se encontró 'AVANZAR'"
-                    except Exception as e:
-                        st.warning(f"Error en fila {i+1} (Recomendaciones): {e}")
-                        fortalecer, avanzar = "ERROR API", "ERROR API"
-                    
-                    fortalecer_lista.append(fortalecer)
-                    avanzar_lista.append(avanzar)
-                    progress_bar_recom.progress((i + 1) / total_filas, text=f"Generando Recomendación {i+1}/{total_filas}")
-                    time.sleep(1)
-
-                df["Recomendacion_Fortalecer"] = fortalecer_lista
-                df["Recomendacion_Avanzar"] = avanzar_lista
-                st.success("Recomendaciones generadas con éxito.")
-            
-            st.session_state.df_enriquecido = df
-            st.balloons()
-
-# --- PASOS 3, 4 Y 5 (sin cambios) ---
+            lanzar_enriquecimiento(
+                model, f"Enriquecimiento de {archivo_excel.name}",
+                contenido_excel=archivo_excel.getvalue(), columnas=columnas_lectura, reanudar=reanudar_ejecucion,
+                solo_errores=solo_errores
+            )
+
+panel_tareas()
+
+# --- PASOS 3, 4 Y 5: revisión y reintento, ensamblaje en segundo plano y descarga ---
 if st.session_state.df_enriquecido is not None:
     st.header("Paso 3: Verifica los Datos Enriquecidos")
     st.dataframe(st.session_state.df_enriquecido.head())
+
+    # Reintento selectivo: solo las filas que quedaron marcadas como ERROR.
+    pendientes = filas_con_error(st.session_state.df_enriquecido)
+    filas_pendientes = len(set(pendientes[ANALISIS]) | set(pendientes[RECOMENDACIONES]))
+    if filas_pendientes:
+        st.warning(f"{filas_pendientes} fila(s) tienen celdas marcadas como ERROR.")
+        if st.button("🔁 Reintentar solo las filas con ERROR", disabled=not api_key):
+            model = cargar_modelo(api_key)
+            if model:
+                lanzar_enriquecimiento(
+                    model, "Reintento de las filas con ERROR", df=st.session_state.df_enriquecido.copy(),
+                    pendientes=pendientes, solo_errores=True, ruta_bitacora=st.session_state.ruta_bitacora
+                )
     
-    output_excel = BytesIO()
-    with pd.ExcelWriter(output_excel, engine='openpyxl') as writer:
-        st.session_state.df_enriquecido.to_excel(writer, index=False, sheet_name='Datos Enriquecidos')
-    output_excel.seek(0)
-    
+    # Solo se regenera si cambió el DataFrame, no en cada rerun de la página.
+    def excel_enriquecido():
+        with exportar_excel(st.session_state.df_enriquecido, umbral_memoria=umbral_memoria_mb * 1024 * 1024) as archivo:
+            return archivo.read()
+
+    output_excel = exportaciones.obtener(("excel", st.session_state.huella_df), excel_enriquecido)
+
     st.download_button(
         label="📥 Descargar Excel Enriquecido",
         data=output_excel,
@@ -379,42 +433,72 @@ if st.session_state.df_enriquecido is not None:
             "Escribe el nombre de la columna para nombrar los archivos (ej. ItemId)", 
             value="ItemId"
         )
-        
+        procesos_ensamblaje = st.number_input(
+            "Procesos para renderizar las fichas",
+            min_value=1, max_value=64, value=os.cpu_count() or 1,
+            help="Cada proceso prepara la plantilla una vez y renderiza fichas en paralelo. "
+                 "Arrancarlos cuesta unos segundos: con pocas fichas se renderiza sin pool."
+        )
+        max_mb_volumen = st.number_input(
+            "Tamaño máximo de cada archivo .zip (MB, 0 = un solo archivo)",
+            min_value=0, value=0,
+            help="Divide la salida en varios volúmenes para descargas más livianas."
+        )
+        reutilizar_fichas = st.checkbox(
+            "Reutilizar las fichas sin cambios del último ensamblaje", value=True,
+            help="Solo se renderizan las filas nuevas o modificadas (o todas si cambió la plantilla); "
+                 "las demás se copian del .zip anterior y las filas eliminadas desaparecen."
+        )
+
         if st.button("📄 Ensamblar Fichas Técnicas", type="primary"):
             df_final = st.session_state.df_enriquecido
             if columna_nombre_archivo not in df_final.columns:
                 st.error(f"La columna '{columna_nombre_archivo}' no existe en el Excel. Por favor, elige una de: {', '.join(df_final.columns)}")
             else:
-                with st.spinner("Ensamblando todas las fichas en un archivo .zip..."):
-                    plantilla_bytes = BytesIO(archivo_plantilla.getvalue())
-                    zip_buffer = BytesIO()
-                    
-                    with zipfile.ZipFile(zip_buffer, "a", zipfile.ZIP_DEFLATED, False) as zip_file:
-                        total_docs = len(df_final)
-                        progress_bar_zip = st.progress(0, text="Iniciando ensamblaje...")
-                        for i, fila in df_final.iterrows():
-                            doc = DocxTemplate(plantilla_bytes)
-                            contexto = fila.to_dict()
-                            doc.render(contexto)
-                            
-                            doc_buffer = BytesIO()
-                            doc.save(doc_buffer)
-                            doc_buffer.seek(0)
-                            
-                            nombre_base = str(fila[columna_nombre_archivo]).replace('/', '_').replace('\\', '_')
-                            nombre_archivo_salida = f"{nombre_base}.docx"
-                            
-                            zip_file.writestr(nombre_archivo_salida, doc_buffer.getvalue())
-                            progress_bar_zip.progress((i + 1) / total_docs, text=f"Añadiendo ficha {i+1}/{total_docs} al .zip")
-                    
-                    st.session_state.zip_buffer = zip_buffer
-                    st.success("¡Ensamblaje completado!")
-
-if st.session_state.zip_buffer:
+                plantilla_bytes = archivo_plantilla.getvalue()
+                clave_zip = ("zip", propietario, st.session_state.huella_df, huella(plantilla_bytes), columna_nombre_archivo, max_mb_volumen)
+                anterior = gestor.obtener(artefactos.buscar(clave_zip), propietario)
+                if anterior is not None and not anterior.terminada:
+                    # El mismo ensamblaje ya está en marcha: se sigue su avance.
+                    st.session_state.tarea_ensamblaje = anterior.id
+                    st.rerun()
+                elif anterior is not None and anterior.estado == COMPLETADA and all(map(os.path.exists, anterior.resultado["volumenes"])):
+                    usar_resultado(anterior)
+                    st.info("Ni los datos ni la plantilla cambiaron: se reutiliza el último ensamblaje.")
+                else:
+                    # Los volúmenes quedan en la carpeta de la tarea, en disco.
+                    tarea = gestor.enviar(
+                        ENSAMBLAJE, f"Ensamblaje de {len(df_final)} fichas", ejecutar_ensamblaje,
+                        df_final, plantilla_bytes, columna_nombre_archivo,
+                        procesos=procesos_ensamblaje, max_bytes_volumen=max_mb_volumen * 1024 * 1024,
+                        anterior=ultimo_manifiesto() if reutilizar_fichas else None, propietario=propietario,
+                        perfilar=perfilar
+                    )
+                    artefactos.guardar(clave_zip, tarea.id, tamano=0)
+                    st.session_state.tarea_ensamblaje = tarea.id
+                    st.rerun()
+
+if st.session_state.zip_volumenes:
     st.header("Paso 5: Descarga el Resultado Final")
-    st.download_button(
-        label="📥 Descargar TODAS las fichas (.zip)",
-        data=st.session_state.zip_buffer,
-        file_name="fichas_tecnicas_generadas.zip",
-        mime="application/zip"
-    )
+    volumenes = [ruta for ruta in st.session_state.zip_volumenes if os.path.exists(ruta)]
+    if len(volumenes) < len(st.session_state.zip_volumenes):
+        st.warning("Algunos archivos .zip ya no existen (la tarea se descartó); vuelve a ensamblar.")
+    for numero, ruta in enumerate(volumenes, start=1):
+        sufijo = f"_parte{numero:02d}" if len(volumenes) > 1 else ""
+        etiqueta = f" (parte {numero} de {len(volumenes)})" if len(volumenes) > 1 else ""
+        with open(ruta, "rb") as volumen:
+            st.download_button(
+                label=f"📥 Descargar TODAS las fichas (.zip){etiqueta}",
+                data=volumen,
+                file_name=f"fichas_tecnicas_generadas{sufijo}.zip",
+                mime="application/zip",
+                key=f"descarga_zip_{numero}"
+            )
+
+# --- Telemetría de las últimas tareas cargadas ---
+tareas_telemetria = [gestor.obtener(id_tarea, propietario) for id_tarea in st.session_state.tareas_cargadas.values()]
+tareas_telemetria = [tarea for tarea in tareas_telemetria if tarea is not None and tarea.resultado.get("telemetria")]
+if tareas_telemetria:
+    st.header("📊 Telemetría de la Ejecución")
+    for tarea in tareas_telemetria:
+        mostrar_telemetria(tarea)